@@ -0,0 +1,405 @@
+"""Precomputed catalogue aggregates and related-book recommendations.
+
+`CatalogStats` keeps per-category and per-author counts and price ranges.
+`RelatedBooks` keeps, for every book, its most similar books by TF-IDF
+cosine similarity over title and description. Both are built at startup and
+updated per book by the write endpoints, so serving them is a dict lookup.
+Similarity updates are too slow for the event loop, so they are queued and
+applied on a background worker thread.
+"""
+import asyncio
+import heapq
+import math
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from search_index import tokenize
+
+RELATED_LIMIT = int(os.environ.get('RELATED_LIMIT', '10'))
+# Vocabulary size cap
+RELATED_MAX_FEATURES = int(os.environ.get('RELATED_MAX_FEATURES', '4096'))
+# Each book keeps only its strongest terms, so vectors take books x terms x 8 bytes
+RELATED_MAX_TERMS = int(os.environ.get('RELATED_MAX_TERMS', '64'))
+# The build is O(books^2), about 20s at 20k books; above this many books
+# related lists are switched off
+RELATED_MAX_BOOKS = int(os.environ.get('RELATED_MAX_BOOKS', '20000'))
+# Once writes since the last build pass this share of the books built from,
+# their new terms deserve a new vocabulary; an empty build always does
+RELATED_REBUILD_RATIO = float(os.environ.get('RELATED_REBUILD_RATIO', '0.1'))
+# Scores and gathered postings held in memory at once while comparing books in blocks
+RELATED_BLOCK_CELLS = 1 << 22
+# Terms in more than this share of books are compared with a dense matrix
+# multiply rather than through their postings, up to this many of them
+RELATED_DENSE_SHARE = 1 / 32
+RELATED_DENSE_COLUMNS = 256
+TITLE_WEIGHT = 2
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has he her his in is it its of on or that the their this to "
+    "was were will with you your who what when how all can into our not".split()
+)
+
+# One thread, so builds and updates of a RelatedBooks never overlap
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="related")
+
+
+class CatalogStats:
+    """Per-category and per-author counts, featured counts and price ranges"""
+
+    GROUPS = ("category", "author")
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.books = {}  # book_id -> the fields aggregated over
+        self.members = {group: {} for group in self.GROUPS}  # group -> key -> {book_id: price}
+        self.featured = {group: Counter() for group in self.GROUPS}
+        self.summaries = {group: {} for group in self.GROUPS}
+
+    def build(self, books):
+        self._reset()
+        for book in books:
+            self.add(book)
+
+    def add(self, book):
+        """Add a book, or move a changed book between groups"""
+        self.remove(book["id"])
+        entry = {
+            "category": book.get("category"),
+            "author": book.get("author"),
+            "price": float(book.get("price") or 0),
+            "featured": bool(book.get("featured")),
+        }
+        self.books[book["id"]] = entry
+        for group in self.GROUPS:
+            key = entry[group]
+            self.members[group].setdefault(key, {})[book["id"]] = entry["price"]
+            self.featured[group][key] += entry["featured"]
+            self._summarise(group, key)
+
+    def remove(self, book_id):
+        entry = self.books.pop(book_id, None)
+        if entry is None:
+            return
+        for group in self.GROUPS:
+            key = entry[group]
+            del self.members[group][key][book_id]
+            self.featured[group][key] -= entry["featured"]
+            self._summarise(group, key)
+
+    def _summarise(self, group, key):
+        prices = self.members[group].get(key)
+        if not prices:
+            self.members[group].pop(key, None)
+            self.featured[group].pop(key, None)
+            self.summaries[group].pop(key, None)
+            return
+        values = prices.values()
+        self.summaries[group][key] = {
+            "count": len(prices),
+            "featured": self.featured[group][key],
+            "min_price": min(values),
+            "max_price": max(values),
+            "avg_price": round(sum(values) / len(prices), 2),
+        }
+
+
+class RelatedBooks:
+    """Top-N most similar books per book by TF-IDF cosine similarity
+
+    The vocabulary and IDF weights are fixed by `build()`; books added later
+    are vectorised with them until the next full build, which `needs_build()`
+    says is due once enough books have been written since. Vectors are stored
+    sparsely as each book's RELATED_MAX_TERMS strongest (column, weight)
+    pairs. `build()` and `add()` are slow and meant for the worker thread
+    that `build_async()` and `schedule()` use; `get()` is safe on the loop.
+    """
+
+    def __init__(self, limit=RELATED_LIMIT, max_features=RELATED_MAX_FEATURES,
+                 max_books=RELATED_MAX_BOOKS, max_terms=RELATED_MAX_TERMS):
+        self.limit = limit
+        self.max_features = max_features
+        self.max_books = max_books
+        self.max_terms = max_terms
+        self.enabled = True
+        self.vocabulary = {}
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.ids = []
+        self.rows = {}  # book_id -> row in columns/weights
+        # The arrays are views onto storage with spare capacity
+        self._allocate(0)
+        self.related = {}  # book_id -> [(score, book_id)], best first
+        self.referrers = {}  # book_id -> ids whose related list includes it
+        self.built_count = 0
+        self.writes_since_build = 0
+        self._lock = threading.Lock()
+        self._queued = {}  # book_id -> latest version waiting for add()
+        self._draining = False
+
+    @property
+    def width(self):
+        # Padding entries point at column 0, so there is always one
+        return max(1, len(self.vocabulary))
+
+    def _allocate(self, capacity):
+        self._columns_storage = np.zeros((capacity, self.max_terms), dtype=np.int32)
+        self._weights_storage = np.zeros((capacity, self.max_terms), dtype=np.float32)
+        self._cutoff_storage = np.zeros(capacity, dtype=np.float32)
+        self._view(min(capacity, len(self.ids)))
+
+    def _view(self, rows):
+        self.columns = self._columns_storage[:rows]
+        self.weights = self._weights_storage[:rows]
+        self.cutoff = self._cutoff_storage[:rows]  # per row: score needed to enter its list
+
+    @staticmethod
+    def _terms(book):
+        title = [t for t in tokenize(book.get("title")) if t not in STOP_WORDS]
+        description = [t for t in tokenize(book.get("description")) if t not in STOP_WORDS]
+        return Counter(title * TITLE_WEIGHT + description)
+
+    def _vector(self, terms):
+        """(columns, weights) of a book's strongest terms, normalised and zero padded"""
+        weighted = []
+        for term, tf in terms.items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                weighted.append(((1 + math.log(tf)) * self.idf[column], column))
+        columns = np.zeros(self.max_terms, dtype=np.int32)
+        weights = np.zeros(self.max_terms, dtype=np.float32)
+        strongest = heapq.nlargest(self.max_terms, weighted)
+        if strongest:
+            weights[:len(strongest)], columns[:len(strongest)] = zip(*strongest)
+            weights /= np.linalg.norm(weights)
+        return columns, weights
+
+    def _postings(self):
+        """The stored vectors arranged for comparing every book with every other
+
+        Columns most books share go in a dense books x columns block that a
+        matrix multiply compares; the rest are inverted, with column c's
+        (rows, weights) at starts[c]:starts[c + 1].
+        """
+        # Leave out the padding, which would otherwise all pile up in column 0
+        rows, slots = np.nonzero(self.weights)
+        columns = self.columns[rows, slots]
+        weights = self.weights[rows, slots]
+        frequency = np.bincount(columns, minlength=self.width)
+        common = np.argsort(-frequency, kind="stable")[:RELATED_DENSE_COLUMNS]
+        common = common[frequency[common] > RELATED_DENSE_SHARE * len(self.ids)]
+        dense_column = np.full(self.width, -1)
+        dense_column[common] = np.arange(len(common))
+        dense = np.zeros((len(self.ids), len(common)), dtype=np.float32)
+        in_dense = dense_column[columns] >= 0
+        dense[rows[in_dense], dense_column[columns[in_dense]]] = weights[in_dense]
+
+        rows, columns, weights = rows[~in_dense], columns[~in_dense], weights[~in_dense]
+        order = np.argsort(columns, kind="stable")
+        starts = np.searchsorted(columns[order], np.arange(self.width + 1))
+        return dense_column, dense, starts, rows[order], weights[order]
+
+    def _sparse_terms(self, postings, rows):
+        """(query, column, weight, posting count) of each term of `rows` that isn't in the dense block"""
+        dense_column, starts = postings[0], postings[2]
+        weights = np.where(dense_column[self.columns[rows]] < 0, self.weights[rows], 0)
+        query, slots = np.nonzero(weights)
+        columns = self.columns[rows][query, slots]
+        return query, columns, weights[query, slots], starts[columns + 1] - starts[columns]
+
+    def _posting_blocks(self, postings, rows):
+        """Split `rows` into runs whose scores and gathered postings fit in RELATED_BLOCK_CELLS"""
+        query, _, _, lengths = self._sparse_terms(postings, rows)
+        # Each row also needs two rows of scores: the dense product and the postings' sum
+        cost = np.cumsum(np.bincount(query, weights=lengths, minlength=len(rows)) + 2 * len(self.ids))
+        begin = 0
+        while begin < len(rows):
+            spent = cost[begin - 1] if begin else 0
+            end = max(begin + 1, int(np.searchsorted(cost, spent + RELATED_BLOCK_CELLS, side="right")))
+            yield rows[begin:end]
+            begin = end
+
+    def _posting_scores(self, postings, rows):
+        """Similarity of each of `rows` to every book, one row of scores per query"""
+        _, dense, starts, posting_rows, posting_weights = postings
+        scores = dense[rows] @ dense.T
+        query, columns, weights, lengths = self._sparse_terms(postings, rows)
+        if not lengths.sum():
+            return scores
+        # Where each query term's postings start, repeated once per posting
+        ends = np.cumsum(lengths)
+        positions = np.repeat(starts[columns] - ends + lengths, lengths) + np.arange(ends[-1])
+        products = np.repeat(weights, lengths) * posting_weights[positions]
+        n = len(self.ids)
+        cells = np.repeat(query, lengths) * n + posting_rows[positions]
+        scores += np.bincount(cells, weights=products, minlength=len(rows) * n).reshape(len(rows), n)
+        return scores
+
+    def _similarities(self, dense):
+        """Every book's score against dense query vectors, one column per query"""
+        # Only stored entries in columns the queries use can score
+        used = dense.any(axis=1)
+        rows, slots = np.nonzero(used[self.columns] & (self.weights != 0))
+        scores = np.zeros((len(self.ids), dense.shape[1]), dtype=np.float32)
+        if len(rows):
+            products = self.weights[rows, slots, None] * dense[self.columns[rows, slots]]
+            # Entries come grouped by row, so each group sums to that book's scores
+            firsts = np.flatnonzero(np.diff(rows, prepend=-1))
+            scores[rows[firsts]] = np.add.reduceat(products, firsts)
+        return scores
+
+    def _dense(self, rows):
+        """Dense vocabulary-wide vectors for some rows, one per column"""
+        dense = np.zeros((self.width, len(rows)), dtype=np.float32)
+        np.add.at(dense, (self.columns[rows], np.arange(len(rows))[:, None]), self.weights[rows])
+        return dense
+
+    def _block_size(self):
+        return max(1, RELATED_BLOCK_CELLS // max(1, len(self.ids)))
+
+    def _top(self, scores, exclude_row):
+        """Best `limit` (score, book_id) pairs from a row of similarity scores"""
+        scores = np.array(scores, dtype=np.float32)
+        scores[exclude_row] = -1
+        count = min(self.limit, len(scores) - 1)
+        if count <= 0:
+            return []
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best])]
+        return [(float(scores[row]), self.ids[row]) for row in best if scores[row] > 0]
+
+    def _set_related(self, book_id, pairs):
+        for _, old_id in self.related.get(book_id, []):
+            self.referrers.get(old_id, set()).discard(book_id)
+        for _, new_id in pairs:
+            self.referrers.setdefault(new_id, set()).add(book_id)
+        self.related[book_id] = pairs
+        self.cutoff[self.rows[book_id]] = pairs[-1][0] if len(pairs) >= self.limit else 0
+
+    def _grow(self, rows):
+        """Make room for `rows` books, doubling the backing arrays when full"""
+        if rows > len(self._columns_storage):
+            columns, weights, cutoff = self.columns, self.weights, self.cutoff
+            self._allocate(max(rows, 2 * len(self._columns_storage), 64))
+            self._columns_storage[:len(columns)] = columns
+            self._weights_storage[:len(weights)] = weights
+            self._cutoff_storage[:len(cutoff)] = cutoff
+        self._view(rows)
+
+    def build(self, books):
+        """Recompute the vocabulary, vectors and every related list"""
+        books = list(books)
+        self.built_count = len(books)
+        self.writes_since_build = 0
+        self.enabled = len(books) <= self.max_books
+        if not self.enabled:
+            print(f"Related books disabled: {len(books)} books is over RELATED_MAX_BOOKS ({self.max_books})")
+            return
+        term_counts = [self._terms(book) for book in books]
+        document_frequency = Counter()
+        for terms in term_counts:
+            document_frequency.update(terms.keys())
+        n = len(books)
+        # Terms in more than half the catalogue don't tell books apart
+        candidates = [term for term, df in document_frequency.items() if df <= max(1, n // 2)]
+        candidates.sort(key=lambda term: -document_frequency[term])
+        vocabulary = {term: column for column, term in enumerate(candidates[:self.max_features])}
+
+        self.vocabulary = vocabulary
+        self.idf = np.array(
+            [math.log((1 + n) / (1 + document_frequency[term])) + 1 for term in vocabulary], dtype=np.float32
+        )
+        self.ids = [book["id"] for book in books]
+        self.rows = {book_id: row for row, book_id in enumerate(self.ids)}
+        self._allocate(n)
+        for row, terms in enumerate(term_counts):
+            self.columns[row], self.weights[row] = self._vector(terms)
+
+        self.related = {}
+        self.referrers = {}
+        # Comparing every pair only pays for the terms books share
+        postings = self._postings()
+        for rows in self._posting_blocks(postings, np.arange(n)):
+            for row, scores in zip(rows, self._posting_scores(postings, rows)):
+                self._set_related(self.ids[row], self._top(scores, row))
+
+    def add(self, book):
+        """Insert or re-vectorise one book and patch the lists that involve it"""
+        if not self.enabled:
+            return
+        book_id = book["id"]
+        row = self.rows.get(book_id)
+        if row is None:
+            row = len(self.ids)
+            self._grow(row + 1)
+            self.ids.append(book_id)
+            self.rows[book_id] = row
+        self.columns[row], self.weights[row] = self._vector(self._terms(book))
+
+        scores = self._similarities(self._dense([row]))[:, 0]
+        self._set_related(book_id, self._top(scores, row))
+
+        # Lists that held this book: its score may have dropped, so recompute
+        # them, a block of lists at a time
+        stale = sorted(self.referrers.get(book_id, set()) - {book_id})
+        block_size = self._block_size()
+        for start in range(0, len(stale), block_size):
+            other_ids = stale[start:start + block_size]
+            other_rows = [self.rows[other_id] for other_id in other_ids]
+            block = self._similarities(self._dense(other_rows))
+            for column, (other_id, other_row) in enumerate(zip(other_ids, other_rows)):
+                self._set_related(other_id, self._top(block[:, column], other_row))
+
+        # Lists whose weakest entry it now beats: insert it
+        scores[row] = 0
+        stale = set(stale)
+        for other_row in np.nonzero(scores > self.cutoff)[0]:
+            other_id = self.ids[other_row]
+            if other_id in stale:
+                continue
+            current = self.related.get(other_id, []) + [(float(scores[other_row]), book_id)]
+            self._set_related(other_id, sorted(current, reverse=True)[:self.limit])
+
+    async def build_async(self, books):
+        """Run `build()` on the worker thread"""
+        await asyncio.get_running_loop().run_in_executor(_executor, self.build, books)
+
+    def schedule(self, book):
+        """Queue `add(book)` on the worker thread
+
+        Changes to a book that is still queued replace the queued version, so
+        a burst of writes to one book costs a single update.
+        """
+        if not self.enabled:
+            return
+        self.writes_since_build += 1
+        with self._lock:
+            self._queued[book["id"]] = book
+            if self._draining:
+                return
+            self._draining = True
+        asyncio.get_running_loop().run_in_executor(_executor, self._drain)
+
+    def needs_build(self):
+        """Whether enough has been written since `build()` to warrant another"""
+        return self.enabled and self.writes_since_build > RELATED_REBUILD_RATIO * self.built_count
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._queued:
+                    self._draining = False
+                    return
+                book = self._queued.pop(next(iter(self._queued)))
+            try:
+                self.add(book)
+            except Exception as e:
+                print(f"Related books update failed for book {book.get('id')}: {e}")
+
+    def get(self, book_id, limit=None):
+        """Related book ids with scores, most similar first"""
+        return self.related.get(book_id, [])[:limit or self.limit]
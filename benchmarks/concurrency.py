@@ -0,0 +1,41 @@
+"""Concurrency benchmark for the read endpoints.
+
+Drives the FastAPI app in-process at several concurrency levels and prints
+p50/p99 latency per level. Uses the in-process Mongo stand-in unless
+--mongo-url points at a real server:
+
+    python benchmarks/concurrency.py
+    python benchmarks/concurrency.py --mongo-url mongodb://localhost:27017/ --requests 5000
+"""
+import argparse
+import asyncio
+import os
+
+from harness import app_client, run_load
+
+DEFAULT_LEVELS = [1, 50, 500]
+DEFAULT_PATHS = ["/api/books", "/api/featured-books", "/api/categories"]
+
+
+async def main(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    from server import app
+
+    async with app_client(app) as client:
+        async def send(i):
+            return await client.get(args.paths[i % len(args.paths)])
+
+        print(f"{'clients':>8} {'requests':>9} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9}")
+        for level in args.levels:
+            result = await run_load(send, level, max(args.requests, level))
+            print(f"{result['concurrency']:>8} {result['requests']:>9} "
+                  f"{result['throughput']:>10.1f} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongomock://"))
+    parser.add_argument("--levels", type=int, nargs="+", default=DEFAULT_LEVELS)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per concurrency level")
+    parser.add_argument("--paths", nargs="+", default=DEFAULT_PATHS)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,218 @@
+"""Load-test suite for the API with machine-readable results and baseline checks.
+
+For each catalogue size the suite fills a fresh database with synthetic
+books, boots the app in-process and drives every scenario at each
+concurrency level. Results (throughput, p50/p95/p99) are written as JSON and
+can be compared against a stored baseline; the script exits 1 when a
+scenario regresses by more than --max-regression.
+
+    python benchmarks/suite.py --sizes 1k --output results.json
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json
+
+The default in-process stand-in has no real indexes and is only
+representative for small catalogues; point --mongo-url at a throwaway
+mongod for the 100k and 1M runs. Data goes to the database named by
+--db-name, which is dropped and refilled for every size.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import uuid
+
+from harness import app_client, run_load
+
+DEFAULT_SIZES = ["1k", "100k", "1m"]
+DEFAULT_LEVELS = [1, 32, 256]
+INSERT_BATCH_SIZE = 5000
+
+CATEGORIES = [f"Category {n}" for n in range(20)]
+# Titles and descriptions draw from a made-up vocabulary with Zipf-distributed
+# word frequencies, like natural text, so search postings and related-book
+# vectors have realistic sizes at every catalogue size
+VOCABULARY_SIZE = 5000
+ZIPF_EXPONENT = 1.07
+SYLLABLES = [c + v for c in "bcdfghklmnprstvz" for v in "aeiou"]
+
+
+def parse_size(text):
+    """'1k' -> 1000, '1m' -> 1000000"""
+    text = text.lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def vocabulary(size, rng):
+    """`size` distinct pronounceable words, most frequent first"""
+    words = {}
+    while len(words) < size:
+        words["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))] = None
+    return list(words)
+
+
+def synthetic_books(count, rng):
+    """Deterministic pseudo-random catalogue of `count` books"""
+    authors = [f"Author {n}" for n in range(max(10, count // 20))]
+    words = vocabulary(VOCABULARY_SIZE, rng)
+    cum_weights = list(itertools.accumulate(1 / rank ** ZIPF_EXPONENT for rank in range(1, len(words) + 1)))
+
+    def text(low, high):
+        return rng.choices(words, cum_weights=cum_weights, k=rng.randint(low, high))
+
+    for n in range(count):
+        yield {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "title": " ".join(word.title() for word in text(2, 5)),
+            "author": rng.choice(authors),
+            "category": rng.choice(CATEGORIES),
+            "description": " ".join(text(20, 60)),
+            "price": round(rng.uniform(4.99, 59.99), 2),
+            "image_url": f"https://example.com/covers/{n}.jpg",
+            "amazon_link": f"https://www.amazon.com/dp/B{n:09d}",
+            "featured": rng.random() < 0.02,
+            "version": 1,
+        }
+
+
+async def fill_catalogue(collection, count, seed):
+    """Replace the collection contents with `count` synthetic books; returns their ids"""
+    await collection.drop()
+    rng = random.Random(seed)
+    ids = []
+    batch = []
+    for book in synthetic_books(count, rng):
+        ids.append(book["id"])
+        batch.append(book)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            await collection.insert_many(batch)
+            batch = []
+    if batch:
+        await collection.insert_many(batch)
+    return ids
+
+
+def scenarios(client, ids, rng):
+    """Scenario name -> coroutine function sending the i-th request"""
+    new_book = {
+        "title": "Benchmark Book", "author": "Bench", "category": CATEGORIES[0],
+        "description": "Created by the benchmark suite", "price": 9.99,
+        "amazon_link": "https://www.amazon.com/dp/B000000000",
+    }
+    return {
+        "get_books": lambda i: client.get("/api/books", params={"limit": 50}),
+        "get_books_category": lambda i: client.get(
+            "/api/books", params={"category": CATEGORIES[i % len(CATEGORIES)], "limit": 50}
+        ),
+        "get_books_featured": lambda i: client.get("/api/books", params={"featured": "true", "limit": 50}),
+        "get_book": lambda i: client.get(f"/api/books/{rng.choice(ids)}"),
+        "get_categories": lambda i: client.get("/api/categories"),
+        "create_book": lambda i: client.post("/api/books", json=new_book),
+        "update_book": lambda i: client.put(f"/api/books/{rng.choice(ids)}", json={"price": round(rng.uniform(5, 50), 2)}),
+    }
+
+
+async def run_suite(args):
+    # Seeding would mix the sample catalogue into the synthetic one
+    os.environ["SEED_MODE"] = "off"
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["MONGO_DB_NAME"] = args.db_name
+    if not args.cache:
+        os.environ["CACHE_TTL_SECONDS"] = "0"
+    from server import app, db
+
+    results = []
+    for size_name in args.sizes:
+        size = parse_size(size_name)
+        started = time.perf_counter()
+        ids = await fill_catalogue(db.books, size, args.seed)
+        print(f"[{size_name}] seeded {size} books in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+        async with app_client(app) as client:
+            rng = random.Random(args.seed)
+            for name, send in scenarios(client, ids, rng).items():
+                if args.scenarios and name not in args.scenarios:
+                    continue
+                for level in args.levels:
+                    # Warm up pools and caches before measuring
+                    await run_load(send, level, min(level, args.requests))
+                    result = await run_load(send, level, max(args.requests, level))
+                    result.update(size=size_name, scenario=name)
+                    results.append(result)
+                    print(f"[{size_name}] {name:<20} c={level:<4} {result['throughput']:>9.1f} req/s  "
+                          f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                          f"p99={result['p99_ms']:.2f}ms errors={result['errors']}", file=sys.stderr)
+    return {
+        "meta": {
+            "mongo": "mongomock" if args.mongo_url.startswith("mongomock://") else "mongodb",
+            "cache": args.cache,
+            "requests_per_run": args.requests,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, max_regression):
+    """List runs that got slower (p95) or lost throughput beyond the tolerance"""
+    previous = {(r["size"], r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["size"], result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        label = f"{result['size']} {result['scenario']} c={result['concurrency']}"
+        if result["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{label}: p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+        if result["throughput"] < before["throughput"] * (1 - max_regression):
+            regressions.append(f"{label}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{label}: errors {before['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongomock://"))
+    parser.add_argument("--db-name", default="literary_depot_bench")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="catalogue sizes, e.g. 1k 100k 1m")
+    parser.add_argument("--levels", type=int, nargs="+", default=DEFAULT_LEVELS, help="concurrency levels")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario and level")
+    parser.add_argument("--scenarios", nargs="+", help="only run these scenarios")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="disable the catalogue cache")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for the synthetic catalogue")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="compare against this JSON report")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown as a fraction")
+    parser.add_argument("--save-baseline", help="also write the report here as the new baseline")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_suite(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        for line in regressions:
+            print("REGRESSION " + line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+"""Streaming bulk import and export of books.
+
+Imports read NDJSON or CSV from the request body chunk by chunk, validate
+each row against BookCreate and write with bulk_write in batches, so only one
+batch is ever held in memory. Rows are upserted on `id` when given, else on
+the ASIN-based `natural_key` the seed loader uses, so re-running a feed updates
+books in place instead of duplicating them. A title is not unique enough to
+match on, so rows with neither are always added as new books. Only the fields
+a row provides are written to an existing book.
+"""
+import codecs
+import csv
+import json
+import os
+import uuid
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from repository import DEFAULT_IMAGE_URL
+from seed import asin, natural_key, seed_id
+
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', '1000'))
+EXPORT_CHUNK_SIZE = 100
+# Stop reporting individual errors after this many
+MAX_REPORTED_ERRORS = 1000
+
+
+async def iter_lines(chunks):
+    """Decode a byte stream into lines without buffering the whole body"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def parse_ndjson(chunks):
+    """Yield (row_number, row) from NDJSON; rows that don't parse come back as exceptions"""
+    row_number = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("expected a JSON object")
+            yield row_number, row
+        except ValueError as e:
+            yield row_number, e
+
+
+async def parse_csv(chunks):
+    """Yield (row_number, row) from CSV with a header line"""
+    header = None
+    record = []
+    row_number = 0
+    async for line in iter_lines(chunks):
+        # A quoted field can contain newlines; keep reading until the quotes balance
+        record.append(line)
+        if sum(part.count('"') for part in record) % 2:
+            continue
+        text, record = "\n".join(record), []
+        if not text.strip():
+            continue
+        values = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        # Empty cells mean "not provided", e.g. a blank featured column
+        yield row_number, {k: v for k, v in zip(header, values) if v != ""}
+
+
+class BulkImport:
+    """Validate rows and write them to the collection in batches"""
+
+    def __init__(self, collection, model, track=0):
+        self.collection = collection
+        self.model = model
+        # Filters of the rows written, while there are no more than `track` of them
+        self.written = [] if track else None
+        self.track = track
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self._batch = []  # (row_number, UpdateOne)
+
+    def error(self, row_number, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": message})
+
+    async def add(self, row_number, row):
+        self.received += 1
+        if isinstance(row, Exception):
+            self.error(row_number, str(row))
+            return
+        try:
+            parsed = self.model(**row)
+        except ValidationError as e:
+            self.error(row_number, "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()
+            ))
+            return
+        book = parsed.model_dump(exclude_unset=True)
+        # Defaults such as featured=False only apply to new books
+        on_insert = {k: v for k, v in parsed.model_dump().items() if k not in book}
+        on_insert["image_url"] = DEFAULT_IMAGE_URL
+        if asin(book):
+            book["natural_key"] = natural_key(book)
+        else:
+            on_insert["natural_key"] = natural_key(book)
+
+        if row.get("id"):
+            query = {"id": str(row["id"])}
+        elif asin(book):
+            query = {"natural_key": book["natural_key"]}
+            on_insert["id"] = seed_id(book)
+        else:
+            query = {"id": str(uuid.uuid4())}
+        operation = UpdateOne(
+            query, {"$set": book, "$setOnInsert": on_insert, "$inc": {"version": 1}}, upsert=True
+        )
+        if self.written is not None and len(self.written) < self.track:
+            self.written.append(query)
+        else:
+            self.written = None
+        self._batch.append((row_number, operation))
+        if len(self._batch) >= BULK_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        try:
+            result = await self.collection.bulk_write([op for _, op in batch], ordered=False)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            details = e.details
+            for write_error in details.get("writeErrors", []):
+                self.error(batch[write_error["index"]][0], write_error.get("errmsg", "write failed"))
+        self.inserted += details.get("nUpserted", 0)
+        self.updated += details.get("nMatched", 0)
+
+    def summary(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": self.errors,
+        }
+
+
+async def import_books(collection, model, rows, track=0):
+    """Run a bulk import over (row_number, row) pairs
+
+    Returns the summary and, when at most `track` rows were accepted, the
+    filters matching the books they wrote (else None).
+    """
+    importer = BulkImport(collection, model, track)
+    async for row_number, row in rows:
+        await importer.add(row_number, row)
+    await importer.flush()
+    return importer.summary(), importer.written
+
+
+async def export_ndjson(docs):
+    """Encode a stream of documents as NDJSON, a few documents per chunk"""
+    lines = []
+    async for doc in docs:
+        lines.append(json.dumps(doc, default=str))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -0,0 +1,78 @@
+"""In-process cache for catalogue reads.
+
+The catalogue changes rarely and only through the write endpoints, so read
+views are kept in memory and the write endpoints call `invalidate()`. Every
+invalidation bumps `version`. With several workers each process has its own
+cache, so the TTL bounds how long a write made through another worker can
+take to show up.
+"""
+import os
+import time
+from collections import OrderedDict
+
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '1024'))
+
+
+class CatalogCache:
+    """Versioned TTL + LRU cache with hit/miss counters"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return (True, value) for a live entry, else (False, None)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, value
+            del self._entries[key]
+        self.misses += 1
+        return False, None
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry if full"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key, loader):
+        """Return the cached value for key, calling `await loader()` on a miss"""
+        found, value = self.get(key)
+        if found:
+            return value
+        version = self.version
+        value = await loader()
+        # Don't store a result that was read before a concurrent write
+        if value is not None and version == self.version:
+            self.set(key, value)
+        return value
+
+    def invalidate(self):
+        """Drop everything after a catalogue write"""
+        self._entries.clear()
+        self.version += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,271 @@
+"""Cover upload pipeline.
+
+Uploads are parsed straight from the request body and streamed to disk in
+chunks off the event loop, so the size cap applies while the body is still
+arriving rather than after a framework has spooled it. Files are identified
+by their magic bytes rather than the client's filename. Files are
+stored under their content hash, so every URL is safe to cache forever.
+Resized WebP and JPEG derivatives are produced on a worker pool after the
+upload has been accepted.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.exceptions import MultipartParseError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart before 0.0.13 only installs `multipart`
+    from multipart.exceptions import MultipartParseError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+try:
+    from PIL import Image
+except ImportError:  # without Pillow only the original upload is served
+    Image = None
+
+UPLOAD_DIR = "uploads"
+COVERS_DIR = os.path.join(UPLOAD_DIR, "covers")
+COVERS_URL = "/uploads/covers"
+MAX_COVER_BYTES = int(os.environ.get('MAX_COVER_BYTES', str(10 * 1024 * 1024)))
+COVER_WORKERS = int(os.environ.get('COVER_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Room for multipart boundaries and part headers on top of the cover itself
+MAX_FORM_OVERHEAD = 64 * 1024
+# Enough of the file to recognise every format in SIGNATURES
+SNIFF_BYTES = 12
+# Parser chunks are gathered up to this size before each write to disk
+WRITE_BUFFER_BYTES = 64 * 1024
+UPLOAD_FIELD = "file"
+
+# Request body schema for the docs, since the route reads the body itself
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": [UPLOAD_FIELD],
+            "properties": {UPLOAD_FIELD: {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
+# Derivative name -> target width in pixels
+VARIANT_WIDTHS = {"thumbnail": 160, "card": 320, "detail": 800}
+VARIANT_FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}),
+                   "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True})}
+
+# Content types we accept, keyed by magic bytes
+SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+]
+
+_executor = ThreadPoolExecutor(max_workers=COVER_WORKERS, thread_name_prefix="covers")
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles for content-addressed files that never change"""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+def sniff_image_type(head):
+    """Return (extension, content type) for the image in `head`, or None"""
+    for signature, extension, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return extension, content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+def _cover_url(filename):
+    return f"{COVERS_URL}/{filename}"
+
+
+def _too_large():
+    return HTTPException(status_code=413, detail=f"Cover is larger than {MAX_COVER_BYTES} bytes")
+
+
+async def multipart_file(request, field=UPLOAD_FIELD):
+    """Yield the bytes of one file field of a multipart request as they arrive
+
+    Raises 413 before reading anything when Content-Length is already over
+    the cap, and as soon as the body grows past it otherwise.
+    """
+    max_body = MAX_COVER_BYTES + MAX_FORM_OVERHEAD
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_body:
+        raise _too_large()
+    _, params = parse_options_header(request.headers.get("content-type", ""))
+    if b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+
+    part = {"header": b"", "value": b"", "disposition": b"", "wanted": False}
+    found = False
+    data = []
+
+    def on_part_begin():
+        part.update(disposition=b"", wanted=False)
+
+    def on_header_field(buffer, start, end):
+        part["header"] += buffer[start:end]
+
+    def on_header_value(buffer, start, end):
+        part["value"] += buffer[start:end]
+
+    def on_header_end():
+        if part["header"].lower() == b"content-disposition":
+            part["disposition"] = part["value"]
+        part.update(header=b"", value=b"")
+
+    def on_headers_finished():
+        nonlocal found
+        _, options = parse_options_header(part["disposition"])
+        # Only the first file under `field` is kept
+        part["wanted"] = not found and options.get(b"name") == field.encode() and b"filename" in options
+        found = found or part["wanted"]
+
+    def on_part_data(buffer, start, end):
+        if part["wanted"]:
+            data.append(buffer[start:end])
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body:
+                raise _too_large()
+            parser.write(chunk)
+            for piece in data:
+                yield piece
+            data.clear()
+        parser.finalize()
+    except MultipartParseError as e:
+        raise HTTPException(status_code=400, detail=f"Malformed multipart body: {e}")
+    if not found:
+        raise HTTPException(status_code=400, detail=f"Upload the cover as the '{field}' field")
+
+
+async def save_upload(chunks):
+    """Stream uploaded bytes to content-addressed storage
+
+    `chunks` is an async iterable such as `multipart_file(request)`. Returns
+    (path, url, digest, created), where `created` is False when the same image
+    was already stored. Raises 413 when the upload is over MAX_COVER_BYTES
+    and 415 when it isn't a supported image.
+    """
+    os.makedirs(COVERS_DIR, exist_ok=True)
+    temp_path = os.path.join(COVERS_DIR, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    head = b""  # held back until there is enough to identify the format
+    image_type = None
+    out = await run_in_threadpool(open, temp_path, "wb")
+    buffer = bytearray()
+
+    async def write(chunk):
+        digest.update(chunk)
+        buffer.extend(chunk)
+        if len(buffer) >= WRITE_BUFFER_BYTES:
+            await flush()
+
+    async def flush():
+        if buffer:
+            data = bytes(buffer)
+            buffer.clear()
+            await run_in_threadpool(out.write, data)
+
+    def identify(data):
+        found = sniff_image_type(data)
+        if found is None:
+            raise HTTPException(status_code=415, detail="Cover must be a JPEG, PNG, GIF or WebP image")
+        return found
+
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_COVER_BYTES:
+                raise _too_large()
+            if image_type is None:
+                head += chunk
+                if len(head) < SNIFF_BYTES:
+                    continue
+                image_type = identify(head)
+                chunk, head = head, b""
+            await write(chunk)
+        if image_type is None:
+            if not head:
+                raise HTTPException(status_code=400, detail="Empty upload")
+            image_type = identify(head)
+            await write(head)
+        await flush()
+    except BaseException:
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(os.remove, temp_path)
+        raise
+    await run_in_threadpool(out.close)
+
+    filename = f"{digest.hexdigest()[:32]}.{image_type[0]}"
+    path = os.path.join(COVERS_DIR, filename)
+    created = not await run_in_threadpool(os.path.exists, path)
+    await run_in_threadpool(os.replace, temp_path, path)
+    return path, _cover_url(filename), digest.hexdigest()[:32], created
+
+
+def _render_variants(path, digest):
+    """Write every size/format derivative of an original cover (runs on the pool)"""
+    with Image.open(path) as original:
+        original.load()
+        image = original.convert("RGBA") if original.mode in ("P", "LA") else original
+        if image.mode == "RGBA":
+            # JPEG has no alpha channel; flatten onto white
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        variants = {}
+        for name, width in VARIANT_WIDTHS.items():
+            resized = image
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+            variants[name] = {}
+            for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, **options)
+                filename = f"{digest}-{name}.{fmt}"
+                with open(os.path.join(COVERS_DIR, filename), "wb") as f:
+                    f.write(buffer.getvalue())
+                variants[name][fmt] = _cover_url(filename)
+        return variants
+
+
+async def generate_variants(path, digest):
+    """Build resized derivatives on the worker pool; {} when Pillow isn't installed"""
+    if Image is None:
+        return {}
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, _render_variants, path, digest)
@@ -0,0 +1,112 @@
+"""Pre-serialized JSON bodies with ETag revalidation and compressed variants."""
+import gzip
+import hashlib
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class CachedBody:
+    """A serialized JSON body plus its ETag and lazily built encodings"""
+
+    def __init__(self, body, etag=None):
+        self.body = body
+        self.etag = etag or '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        self._encoded = {}
+
+    @classmethod
+    def from_model(cls, adapter, data, etag=None, **dump_options):
+        """Validate `data` through a pydantic TypeAdapter and serialize it once"""
+        return cls(adapter.dump_json(adapter.validate_python(data), **dump_options), etag)
+
+    def encoded(self, encoding):
+        """Return the body in the given content-coding, compressing on first use"""
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+    def variant_etag(self, encoding):
+        # Each content-coding is a distinct representation, so it needs its own strong tag
+        if encoding is None:
+            return self.etag
+        return self.etag[:-1] + "-" + encoding + '"'
+
+    def matches(self, if_none_match):
+        """Check an If-None-Match header against this body's tags"""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags:
+            return True
+        return bool(tags & {self.etag, self.variant_etag("gzip"), self.variant_etag("br")})
+
+
+def version_etag(version):
+    """ETag for a single book, usable as If-Match on writes"""
+    return '"v%d"' % (version or 0)
+
+
+def parse_if_match(value):
+    """Book version named by an If-Match header
+
+    Returns None when there is no header, "*" for any version, else the
+    version number. Raises ValueError for tags that aren't book versions.
+    """
+    if not value:
+        return None
+    tag = value.strip()
+    if tag == "*":
+        return "*"
+    tag = tag.removeprefix("W/").strip('"')
+    # Accept the tag of a compressed variant too
+    tag = tag.split("-")[0]
+    if not tag.startswith("v") or not tag[1:].isdigit():
+        raise ValueError(f"If-Match must be a book version tag such as \"v3\", got {value}")
+    return int(tag[1:])
+
+
+def choose_encoding(accept_encoding, size):
+    """Pick br or gzip from an Accept-Encoding header, or None for identity"""
+    if size < MIN_COMPRESS_SIZE or not accept_encoding:
+        return None
+    offered = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        offered.add(coding.strip().lower())
+    if brotli is not None and "br" in offered:
+        return "br"
+    if "gzip" in offered:
+        return "gzip"
+    return None
+
+
+def cached_response(request, cached, headers=None):
+    """Serve a CachedBody, answering 304 when the client already has it"""
+    encoding = choose_encoding(request.headers.get("accept-encoding"), len(cached.body))
+    response_headers = {
+        "ETag": cached.variant_etag(encoding),
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
+    if headers:
+        response_headers.update(headers)
+
+    if cached.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=response_headers)
+
+    if encoding is None:
+        return Response(cached.body, media_type="application/json", headers=response_headers)
+    response_headers["Content-Encoding"] = encoding
+    return Response(cached.encoded(encoding), media_type="application/json", headers=response_headers)
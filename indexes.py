@@ -0,0 +1,134 @@
+"""Index definitions for the books collection and query-plan checks.
+
+`ensure_indexes()` runs at startup; creating an index that already exists
+with the same spec is a no-op, so it is safe on every boot. `check_query_plans()`
+explains each query shape the routes issue and flags any that fall back to a
+collection scan or sort in memory. It also runs from the command line:
+
+    python indexes.py           # create indexes
+    python indexes.py --check   # create indexes, then exit 1 on any COLLSCAN or SORT
+"""
+import asyncio
+import json
+import sys
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+from pagination import keyset_filter
+from repository import MONGO_DB_NAME, create_client
+
+BOOK_INDEXES = [
+    IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    # Filters used by get_books / get_featured_books, with id as the page tie-breaker.
+    # category_id also serves distinct("category") as a DISTINCT_SCAN.
+    IndexModel([("category", ASCENDING), ("id", ASCENDING)], name="category_id"),
+    IndexModel([("featured", ASCENDING), ("id", ASCENDING)], name="featured_id"),
+    # Sort keys for paged listings
+    IndexModel([("title", ASCENDING), ("id", ASCENDING)], name="title_id"),
+    IndexModel([("price", ASCENDING), ("id", ASCENDING)], name="price_id"),
+    IndexModel([("category", ASCENDING), ("title", ASCENDING), ("id", ASCENDING)], name="category_title_id"),
+    IndexModel([("category", ASCENDING), ("price", ASCENDING), ("id", ASCENDING)], name="category_price_id"),
+    IndexModel([("featured", ASCENDING), ("title", ASCENDING), ("id", ASCENDING)], name="featured_title_id"),
+    IndexModel([("featured", ASCENDING), ("price", ASCENDING), ("id", ASCENDING)], name="featured_price_id"),
+    # Seeding and bulk imports match books on their ASIN/title key
+    IndexModel([("natural_key", ASCENDING)], name="natural_key"),
+]
+
+
+def next_page(query, field, direction):
+    """The filter get_books sends for a page after the first"""
+    value = "x" if field == "title" else 10.0
+    return {"$and": [query, keyset_filter(field, direction, value, "x")]}
+
+
+# Representative query shapes issued by each route
+QUERY_SHAPES = [
+    ("get_books", {"find": "books", "filter": {}, "sort": {"id": 1}}),
+    ("get_books?category", {"find": "books", "filter": {"category": "x"}, "sort": {"id": 1}}),
+    ("get_books?featured", {"find": "books", "filter": {"featured": True}, "sort": {"id": 1}}),
+    ("get_books?sort=price", {"find": "books", "filter": {}, "sort": {"price": 1, "id": 1}}),
+    ("get_books?sort=title", {"find": "books", "filter": {}, "sort": {"title": 1, "id": 1}}),
+    ("get_books?category&sort=price", {"find": "books", "filter": {"category": "x"}, "sort": {"price": 1, "id": 1}}),
+    ("get_books?category&sort=title", {"find": "books", "filter": {"category": "x"}, "sort": {"title": 1, "id": 1}}),
+    ("get_books?featured&sort=price", {"find": "books", "filter": {"featured": True}, "sort": {"price": 1, "id": 1}}),
+    ("get_books?featured&sort=title", {"find": "books", "filter": {"featured": True}, "sort": {"title": 1, "id": 1}}),
+    # Pages after the first add the keyset condition from the cursor
+    ("get_books?cursor", {"find": "books", "filter": next_page({}, "id", 1), "sort": {"id": 1}}),
+    ("get_books?sort=-price&cursor", {
+        "find": "books", "filter": next_page({}, "price", -1), "sort": {"price": -1, "id": -1},
+    }),
+    ("get_books?sort=title&cursor", {
+        "find": "books", "filter": next_page({}, "title", 1), "sort": {"title": 1, "id": 1},
+    }),
+    ("get_books?category&sort=price&cursor", {
+        "find": "books", "filter": next_page({"category": "x"}, "price", 1), "sort": {"price": 1, "id": 1},
+    }),
+    ("get_books?featured&sort=-price&cursor", {
+        "find": "books", "filter": next_page({"featured": True}, "price", -1), "sort": {"price": -1, "id": -1},
+    }),
+    ("get_book / update_book / upload_book_cover", {"find": "books", "filter": {"id": "x"}}),
+    ("get_featured_books", {"find": "books", "filter": {"featured": True}}),
+    ("seed_books", {"find": "books", "filter": {"natural_key": "x"}}),
+    ("get_categories", {"distinct": "books", "key": "category"}),
+]
+
+
+async def ensure_indexes(collection):
+    """Create every index in BOOK_INDEXES that doesn't exist yet"""
+    return await collection.create_indexes(BOOK_INDEXES)
+
+
+def plan_stages(plan):
+    """Flatten the stage names of an explain() winning plan"""
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            for child in plan["inputStages"]:
+                stages.extend(plan_stages(child))
+            break
+        else:
+            plan = None
+    return stages
+
+
+async def check_query_plans(db):
+    """Explain each route's query shape and flag collection scans and in-memory sorts"""
+    results = []
+    for name, command in QUERY_SHAPES:
+        try:
+            explained = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        except (PyMongoError, NotImplementedError, TypeError) as e:
+            results.append({"route": name, "error": str(e), "collscan": None, "sort": None})
+            continue
+        winning_plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+        # Newer servers nest the classic plan under queryPlan
+        stages = plan_stages(winning_plan.get("queryPlan", winning_plan))
+        results.append({
+            "route": name,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            # A blocking SORT stage means no index provides the order
+            "sort": "SORT" in stages,
+        })
+    return {
+        "ok": all(result["collscan"] is False and result["sort"] is False for result in results),
+        "plans": results,
+    }
+
+
+async def main(check):
+    db = create_client()[MONGO_DB_NAME]
+    print("Indexes:", ", ".join(await ensure_indexes(db.books)))
+    if not check:
+        return 0
+    report = await check_query_plans(db)
+    print(json.dumps(report, indent=2))
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main("--check" in sys.argv[1:])))
@@ -0,0 +1,168 @@
+"""Prometheus metrics for HTTP requests and Mongo commands, plus an opt-in profiler.
+
+`MetricsMiddleware` records per-route latency, response size and in-flight
+requests. `MongoCommandMetrics` is a pymongo command listener that times every
+command by collection and operation. Both are exported on /metrics.
+
+Setting PROFILE_SLOW_MS turns on the profiler: a PROFILE_SAMPLE_RATE fraction
+of requests run under pyinstrument (or cProfile when it isn't installed), and
+the trace is written to PROFILE_DIR if the request took longer than that.
+"""
+import cProfile
+import os
+import random
+import re
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily
+from pymongo import monitoring
+
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0.05'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size", ["method", "route"], buckets=SIZE_BUCKETS
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+MONGO_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ["collection", "command"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Failed MongoDB commands", ["collection", "command"])
+
+
+def route_label(scope):
+    """Route template for a request, so /api/books/{book_id} is one series"""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (static files) have no route but set root_path to the mount point
+    return scope.get("root_path") or "<unmatched>"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status, size and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        profiler = start_profiler() if PROFILE_SLOW_MS else None
+        IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec()
+            method, route = scope["method"], route_label(scope)
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            REQUESTS.labels(method, route, str(status)).inc()
+            RESPONSE_SIZE.labels(method, route).observe(size)
+            if profiler is not None:
+                stop_profiler(profiler, scope, elapsed)
+
+
+_profiling = False
+
+
+def start_profiler():
+    """Start profiling a sampled request; only one runs at a time"""
+    global _profiling
+    if _profiling or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    _profiling = True
+    if Profiler is not None:
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler, scope, elapsed):
+    """Stop the profiler and keep its trace if the request was slow"""
+    global _profiling
+    _profiling = False
+    if Profiler is not None:
+        profiler.stop()
+    else:
+        profiler.disable()
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms < PROFILE_SLOW_MS:
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    route = re.sub(r"[^A-Za-z0-9]+", "_", route_label(scope)).strip("_") or "root"
+    name = "%s-%s-%dms-%d" % (scope["method"], route, elapsed_ms, time.time() * 1000)
+    if Profiler is not None:
+        with open(os.path.join(PROFILE_DIR, name + ".html"), "w") as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name + ".prof"))
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by collection and operation"""
+
+    def __init__(self):
+        # request_id -> collection name, filled in when the command starts
+        self._collections = {}
+
+    def started(self, event):
+        # Most commands name the collection under their own name; getMore
+        # puts the cursor id there and the collection under "collection"
+        key = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(key)
+        self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_FAILURES.labels(collection, event.command_name).inc()
+
+
+class StatsCollector:
+    """Expose a dict of numbers from `stats()` as gauges, e.g. the catalogue cache counters"""
+
+    def __init__(self, prefix, stats):
+        self.prefix = prefix
+        self.stats = stats
+
+    def collect(self):
+        for name, value in self.stats().items():
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"{self.prefix}_{name}", f"{self.prefix} {name}", value=value)
@@ -0,0 +1,82 @@
+"""Keyset (cursor) pagination and sparse field projection for book listings."""
+import base64
+import binascii
+import json
+
+# Fields a listing may be sorted on; "id" is always the tie-breaker
+SORT_FIELDS = ("id", "title", "price")
+DEFAULT_SORT = "id"
+
+
+def parse_sort(sort):
+    """Turn "price" / "-price" into (field, direction)"""
+    sort = sort or DEFAULT_SORT
+    direction = 1
+    if sort.startswith("-"):
+        direction = -1
+        sort = sort[1:]
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort on '{sort}', expected one of: {', '.join(SORT_FIELDS)}")
+    return sort, direction
+
+
+def sort_spec(field, direction):
+    """Mongo sort specification with a stable tie-breaker on id"""
+    if field == "id":
+        return [("id", direction)]
+    return [(field, direction), ("id", direction)]
+
+
+def parse_fields(fields, allowed):
+    """Parse a comma separated fields= parameter into a list of field names"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if not names:
+        raise ValueError("fields must name at least one field")
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return names
+
+
+def projection_for(fields, sort_field):
+    """Mongo projection for the requested fields plus the keys a cursor needs"""
+    if fields is None:
+        return {"_id": 0}
+    projection = {name: 1 for name in fields}
+    projection.update({"_id": 0, "id": 1, sort_field: 1})
+    return projection
+
+
+def encode_cursor(doc, field, direction):
+    """Opaque token pointing just past `doc` in the given sort order"""
+    payload = {"s": field, "d": direction, "id": doc["id"]}
+    if field != "id":
+        payload["v"] = doc.get(field)
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, field, direction):
+    """Decode a cursor token, checking it belongs to the same sort order"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        cursor_field, cursor_direction, last_id = payload["s"], payload["d"], payload["id"]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if (cursor_field, cursor_direction) != (field, direction):
+        raise ValueError("Cursor does not match the requested sort order")
+    return payload.get("v"), last_id
+
+
+def keyset_filter(field, direction, value, last_id):
+    """Query clause selecting documents strictly after the cursor position"""
+    op = "$gt" if direction == 1 else "$lt"
+    if field == "id":
+        return {"id": {op: last_id}}
+    return {"$or": [
+        {field: {op: value}},
+        {field: value, "id": {op: last_id}},
+    ]}
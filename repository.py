@@ -0,0 +1,117 @@
+"""Async data access for the books collection, built on Motor."""
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+
+# MongoDB connection settings
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'literary_depot')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '10'))
+MONGO_MAX_IDLE_MS = int(os.environ.get('MONGO_MAX_IDLE_MS', '60000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '2000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+
+# Documents are fetched from the server in batches of this size while streaming
+CURSOR_BATCH_SIZE = int(os.environ.get('MONGO_CURSOR_BATCH_SIZE', '500'))
+
+# Never send Mongo's internal _id back to clients
+DEFAULT_PROJECTION = {"_id": 0}
+
+# Cover used until one is uploaded
+DEFAULT_IMAGE_URL = "https://images.unsplash.com/photo-1544947950-fa07a98d237f"
+
+
+def create_client(url=MONGO_URL, **kwargs):
+    """Create the async Mongo client.
+
+    A ``mongomock://`` URL gives an in-process stand-in (needs the
+    ``mongomock-motor`` package) so the API can run without a server.
+    """
+    if url.startswith("mongomock://"):
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
+    options.update(kwargs)
+    return AsyncIOMotorClient(url, **options)
+
+
+class BookRepository:
+    """Awaitable queries against the books collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def _find(self, query, projection=None, sort=None, limit=0):
+        cursor = self.collection.find(query or {}, projection or DEFAULT_PROJECTION)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor.batch_size(CURSOR_BATCH_SIZE)
+
+    async def stream(self, query=None, projection=None, sort=None, limit=0):
+        """Yield matching books one at a time without materialising the result"""
+        async for doc in self._find(query, projection, sort, limit):
+            yield doc
+
+    async def list(self, query=None, projection=None, sort=None, limit=0):
+        """Return all matching books as a list"""
+        return [doc async for doc in self.stream(query, projection, sort, limit)]
+
+    async def get(self, book_id, projection=None):
+        """Return a single book by ID, or None"""
+        return await self.collection.find_one({"id": book_id}, projection or DEFAULT_PROJECTION)
+
+    async def exists(self, book_id):
+        """Check whether a book with this ID exists"""
+        return await self.collection.count_documents({"id": book_id}, limit=1) > 0
+
+    async def categories(self):
+        """Return the distinct category names"""
+        return await self.collection.distinct("category")
+
+    async def fingerprint(self):
+        """(book count, sum of versions); every write through the API changes it"""
+        result = await self.collection.aggregate([
+            {"$group": {"_id": None, "count": {"$sum": 1}, "versions": {"$sum": "$version"}}}
+        ]).to_list(1)
+        if not result:
+            return 0, 0
+        return result[0]["count"], result[0]["versions"]
+
+    async def insert(self, book):
+        """Insert a new book document"""
+        # insert_one adds an ObjectId _id to the dict it is given
+        await self.collection.insert_one(dict(book))
+        return book
+
+    async def update(self, book_id, fields, match=None, expected_version=None):
+        """Apply a partial update and bump the book's version in one round trip
+
+        Only updates a book that also matches `match` and, when given, is at
+        `expected_version`. Returns the updated book, or None if nothing matched.
+        """
+        query = dict(match or {}, id=book_id)
+        if expected_version is not None:
+            # Books written before versioning have no version field; they count as 0
+            query["version"] = expected_version or None
+        # The post-image is rebuilt from the pre-image: mongomock re-matches the
+        # filter after updating, which a version condition no longer satisfies
+        before = await self.collection.find_one_and_update(
+            query,
+            {"$set": fields, "$inc": {"version": 1}},
+            projection=DEFAULT_PROJECTION,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            return None
+        return dict(before, **fields, version=(before.get("version") or 0) + 1)
@@ -0,0 +1,193 @@
+"""In-process inverted index for catalogue search.
+
+Documents are tokenised over title, author and description and ranked with
+BM25. The index is built from the collection at startup and kept current by
+the write endpoints through `add()`, so searches never touch Mongo. Each
+worker has its own index; writes made through other workers reach it when
+the server's periodic refresh (VIEWS_REFRESH_SECONDS) rebuilds it.
+"""
+import bisect
+import math
+import re
+from collections import Counter, defaultdict
+
+# Field weights applied to term frequencies before BM25 scoring
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Price band facet boundaries (upper bounds, exclusive)
+PRICE_BANDS = [(15, "under-15"), (25, "15-25"), (50, "25-50")]
+TOP_PRICE_BAND = "50-plus"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def price_band(price):
+    for upper, name in PRICE_BANDS:
+        if price < upper:
+            return name
+    return TOP_PRICE_BAND
+
+
+def within_one_typo(a, b):
+    """True when b is a with at most one insert, delete, substitution or swap"""
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) <= 1:
+            return True
+        i, j = diffs[0], diffs[-1]
+        return len(diffs) == 2 and j == i + 1 and a[i] == b[j] and a[j] == b[i]
+    if abs(len(a) - len(b)) != 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    """BM25 inverted index with prefix/typo-tolerant term expansion and facets"""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.books = {}
+        self.postings = defaultdict(dict)  # term -> {book_id: weighted tf}
+        self.doc_terms = {}  # book_id -> terms it is posted under
+        self.doc_lengths = {}
+        self.total_length = 0.0
+        self.terms = []  # sorted vocabulary for prefix lookups
+
+    def __len__(self):
+        return len(self.books)
+
+    def build(self, books):
+        """Rebuild the whole index from an iterable of book documents"""
+        self._reset()
+        for book in books:
+            self._index(book)
+        self.terms = sorted(self.postings)
+
+    def add(self, book):
+        """Index a new book, or re-index one whose fields changed"""
+        new_terms = self._index(book)
+        for term in new_terms:
+            bisect.insort(self.terms, term)
+
+    def remove(self, book_id):
+        if book_id not in self.books:
+            return
+        del self.books[book_id]
+        self.total_length -= self.doc_lengths.pop(book_id)
+        for term in self.doc_terms.pop(book_id):
+            del self.postings[term][book_id]
+            if not self.postings[term]:
+                del self.postings[term]
+                self.terms.pop(bisect.bisect_left(self.terms, term))
+
+    def _index(self, book):
+        self.remove(book["id"])
+        weights = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(book.get(field)):
+                weights[token] += weight
+        self.books[book["id"]] = book
+        self.doc_terms[book["id"]] = set(weights)
+        self.doc_lengths[book["id"]] = sum(weights.values())
+        self.total_length += self.doc_lengths[book["id"]]
+        new_terms = []
+        for term, tf in weights.items():
+            if term not in self.postings:
+                new_terms.append(term)
+            self.postings[term][book["id"]] = tf
+        return new_terms
+
+    def expand(self, token, prefix=False, fuzzy=False):
+        """Vocabulary terms a query token should match"""
+        matches = {token} if token in self.postings else set()
+        if prefix:
+            start = bisect.bisect_left(self.terms, token)
+            for term in self.terms[start:]:
+                if not term.startswith(token):
+                    break
+                matches.add(term)
+        if fuzzy and not matches and len(token) > 3:
+            matches.update(t for t in self.terms if within_one_typo(token, t))
+        return matches
+
+    def score(self, q, prefix=True, fuzzy=True):
+        """BM25 scores for every book matching all query tokens"""
+        tokens = tokenize(q)
+        if not tokens:
+            return {book_id: 0.0 for book_id in self.books}
+        n = len(self.books)
+        avg_length = self.total_length / n if n else 0.0
+        scores = None
+        # Only the last token is still being typed, so only it gets prefix matching
+        for position, token in enumerate(tokens):
+            is_last = position == len(tokens) - 1
+            token_scores = defaultdict(float)
+            for term in self.expand(token, prefix=prefix and is_last, fuzzy=fuzzy):
+                docs = self.postings[term]
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for book_id, tf in docs.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[book_id] / avg_length)
+                    term_score = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    token_scores[book_id] = max(token_scores[book_id], term_score)
+            if scores is None:
+                scores = dict(token_scores)
+            else:
+                scores = {book_id: s + token_scores[book_id] for book_id, s in scores.items() if book_id in token_scores}
+            if not scores:
+                break
+        return scores or {}
+
+    def search(self, q="", category=None, author=None, min_price=None, max_price=None, limit=20):
+        """Ranked hits plus facet counts
+
+        Each facet is counted with every filter applied except its own, so
+        picking a category still shows how many matches the other categories have.
+        """
+        filters = {
+            "category": lambda book: not category or book.get("category") == category,
+            "author": lambda book: not author or book.get("author") == author,
+            "price_band": lambda book: (min_price is None or book.get("price", 0) >= min_price)
+            and (max_price is None or book.get("price", 0) <= max_price),
+        }
+        facets = {name: Counter() for name in filters}
+        hits = []
+        for book_id, score in self.score(q).items():
+            book = self.books[book_id]
+            failed = [name for name, keep in filters.items() if not keep(book)]
+            if len(failed) > 1:
+                continue
+            if not failed:
+                hits.append((score, book))
+            values = {
+                "category": book.get("category"),
+                "author": book.get("author"),
+                "price_band": price_band(book.get("price", 0)),
+            }
+            for name in failed or filters:
+                facets[name][values[name]] += 1
+        hits.sort(key=lambda hit: (-hit[0], hit[1].get("title", "")))
+
+        return {
+            "total": len(hits),
+            "results": [dict(book, score=round(score, 4)) for score, book in hits[:limit]],
+            "facets": {name: dict(counts) for name, counts in facets.items()},
+        }
+
+    def suggest(self, prefix, limit=10):
+        """Autocomplete titles for a partially typed query"""
+        scores = self.score(prefix)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        return [self.books[book_id]["title"] for book_id, _ in ranked[:limit]]
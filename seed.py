@@ -0,0 +1,196 @@
+"""Idempotent catalogue seeding from a JSONL file.
+
+Each seed book is matched on its natural key (the ASIN in its Amazon link,
+falling back to the title), which is stored on the book as `natural_key`, and
+is written with an upsert that only sets fields on insert. New books get a
+stable id derived from the key. Books loaded before the key was stored are
+given it first, so they are adopted under their existing ids rather than
+duplicated. Re-seeding therefore never changes ids that clients have cached
+and never overwrites edits made through the API.
+
+Only one worker seeds at a time: the first to take the lock does the work and
+the others wait for it to finish. A checksum of the seed file and the mode are
+recorded so later boots skip seeding entirely when the file hasn't changed.
+With SEED_MODE=reset that means the wipe happens once per seed file rather
+than once per worker or restart; the command line always resets.
+
+    python seed.py           # upsert the seed file
+    python seed.py --reset   # wipe the collection and reload it
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from repository import MONGO_DB_NAME, create_client
+
+SEED_FILE = os.environ.get('SEED_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seed_books.jsonl'))
+# upsert: add missing seed books, reset: wipe and reload, off: don't seed
+SEED_MODE = os.environ.get('SEED_MODE', 'upsert')
+SEED_BATCH_SIZE = int(os.environ.get('SEED_BATCH_SIZE', '1000'))
+SEED_LOCK_TTL_SECONDS = int(os.environ.get('SEED_LOCK_TTL_SECONDS', '120'))
+
+SEED_NAMESPACE = uuid.UUID("6f1d8a52-3c1e-4b8e-9a57-5b0f3e7c2d41")
+ASIN_RE = re.compile(r"/dp/([A-Z0-9]{10})")
+LOCK_ID = "books"
+
+
+def asin(book):
+    """The ASIN in a book's Amazon link, or None"""
+    match = ASIN_RE.search(book.get("amazon_link") or "")
+    return match.group(1) if match else None
+
+
+def natural_key(book):
+    """ASIN from the Amazon link, or the normalised title when there isn't one"""
+    if asin(book):
+        return "asin:" + asin(book)
+    return "title:" + " ".join((book.get("title") or "").lower().split())
+
+
+def seed_id(book):
+    """Stable book id for a seed entry"""
+    return str(uuid.uuid5(SEED_NAMESPACE, natural_key(book)))
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_batches(path, batch_size=SEED_BATCH_SIZE):
+    """Stream seed books from a JSONL file in lists of batch_size"""
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                batch.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: {e}")
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def backfill_natural_keys(books):
+    """Store `natural_key` on books written before it was recorded; returns how many"""
+    updated = 0
+    operations = []
+    cursor = books.find({"natural_key": {"$exists": False}}, {"_id": 0, "id": 1, "title": 1, "amazon_link": 1})
+    async for book in cursor:
+        operations.append(UpdateOne({"id": book["id"]}, {"$set": {"natural_key": natural_key(book)}}))
+        if len(operations) >= SEED_BATCH_SIZE:
+            updated += (await books.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await books.bulk_write(operations, ordered=False)).modified_count
+    return updated
+
+
+async def acquire_lock(locks, owner, ttl=SEED_LOCK_TTL_SECONDS):
+    """Take the seeding lock, or a lock whose previous holder has expired"""
+    now = datetime.now(timezone.utc)
+    lock = {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}
+    try:
+        await locks.insert_one(dict(lock, _id=LOCK_ID))
+        return True
+    except DuplicateKeyError:
+        taken = await locks.find_one_and_update(
+            {"_id": LOCK_ID, "expires_at": {"$lt": now}}, {"$set": lock}
+        )
+        return taken is not None
+
+
+async def release_lock(locks, owner):
+    await locks.delete_one({"_id": LOCK_ID, "owner": owner})
+
+
+async def wait_for_lock(locks, timeout=SEED_LOCK_TTL_SECONDS, interval=0.5):
+    """Wait until whoever holds the seeding lock has released it"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not await locks.find_one({"_id": LOCK_ID}):
+            return
+        await asyncio.sleep(interval)
+
+
+async def already_seeded(db, checksum, mode):
+    """Whether this seed file has already been applied in this mode"""
+    state = await db.seed_state.find_one({"_id": LOCK_ID})
+    if not state or state.get("checksum") != checksum:
+        return False
+    if mode == "reset":
+        return state.get("mode") == "reset"
+    return await db.books.estimated_document_count() > 0
+
+
+async def seed_books(db, path=SEED_FILE, mode=SEED_MODE, force=False):
+    """Bring the books collection up to date with the seed file"""
+    if mode == "off" or not os.path.exists(path):
+        return "skipped"
+    if mode not in ("upsert", "reset"):
+        raise ValueError(f"Unknown SEED_MODE '{mode}', expected upsert, reset or off")
+
+    checksum = file_checksum(path)
+    if not force and await already_seeded(db, checksum, mode):
+        return "up to date"
+
+    owner = f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if not await acquire_lock(db.seed_locks, owner):
+        await wait_for_lock(db.seed_locks)
+        return "seeded by another worker"
+
+    try:
+        # The previous holder may have finished the same work while we booted
+        if not force and await already_seeded(db, checksum, mode):
+            return "up to date"
+        if mode == "reset":
+            await db.books.delete_many({})
+        else:
+            await backfill_natural_keys(db.books)
+        inserted = 0
+        for batch in read_batches(path):
+            operations = []
+            for book in batch:
+                book = {k: v for k, v in book.items() if k != "id"}
+                book["natural_key"] = natural_key(book)
+                book["id"] = seed_id(book)
+                book["version"] = 1
+                operations.append(UpdateOne(
+                    {"natural_key": book["natural_key"]}, {"$setOnInsert": book}, upsert=True
+                ))
+            result = await db.books.bulk_write(operations, ordered=False)
+            inserted += result.upserted_count
+        await db.seed_state.update_one(
+            {"_id": LOCK_ID},
+            {"$set": {"checksum": checksum, "mode": mode, "seeded_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    finally:
+        await release_lock(db.seed_locks, owner)
+    return f"inserted {inserted} books"
+
+
+async def main(mode):
+    db = create_client()[MONGO_DB_NAME]
+    print(await seed_books(db, mode=mode, force=mode == "reset"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main("reset" if "--reset" in sys.argv[1:] else "upsert"))
@@ -1,12 +1,26 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, Query, Request, Response, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, List, Optional
+import asyncio
 import uuid
+import json
 import os
-import shutil
-from pymongo import MongoClient
+from repository import BookRepository, create_client, DEFAULT_IMAGE_URL, MONGO_DB_NAME
+import pagination
+from catalog_cache import CACHE_TTL_SECONDS, CatalogCache
+from http_cache import CachedBody, cached_response, parse_if_match, version_etag
+from search_index import SearchIndex
+from aggregates import CatalogStats, RelatedBooks, RELATED_LIMIT
+from starlette.concurrency import run_in_threadpool
+from indexes import check_query_plans, ensure_indexes
+from seed import natural_key, seed_books
+import bulk
+import covers
+from metrics import MetricsMiddleware, MongoCommandMetrics, StatsCollector
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
 app = FastAPI(title="Literary Depot API", version="1.0.0")
 
@@ -17,16 +31,40 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-# Create uploads directory if it doesn't exist
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Request latency/size metrics, exported on /metrics
+app.add_middleware(MetricsMiddleware)
 
-# MongoDB connection
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
-db = client.literary_depot
+# Create uploads directories if they don't exist
+os.makedirs(covers.COVERS_DIR, exist_ok=True)
+# Covers are content-addressed and cached forever, so they are mounted ahead of /uploads
+app.mount(covers.COVERS_URL, covers.ImmutableStaticFiles(directory=covers.COVERS_DIR), name="covers")
+app.mount("/uploads", StaticFiles(directory=covers.UPLOAD_DIR), name="uploads")
+
+# MongoDB connection (async, pooled)
+client = create_client(event_listeners=[MongoCommandMetrics()])
+db = client[MONGO_DB_NAME]
+books_repo = BookRepository(db.books)
+
+# In-memory cache for catalogue reads, invalidated by the write endpoints
+catalog_cache = CatalogCache()
+REGISTRY.register(StatsCollector("catalog_cache", catalog_cache.stats))
+
+# Full-text search index, built at startup and updated by the write endpoints
+search_index = SearchIndex()
+
+# The in-memory views are per worker. Each worker checks the catalogue this
+# often and rebuilds them when another worker has written to it; 0 turns it off
+VIEWS_REFRESH_SECONDS = float(os.environ.get('VIEWS_REFRESH_SECONDS', str(CACHE_TTL_SECONDS)))
+
+# Bulk imports up to this many rows patch the views book by book; larger ones rebuild them
+BULK_REFRESH_MAX_ROWS = int(os.environ.get('BULK_REFRESH_MAX_ROWS', '500'))
+
+# Per-category/author aggregates and related-book lists, maintained like the search index
+catalog_stats = CatalogStats()
+related_books = RelatedBooks()
 
 # Pydantic models
 class Book(BaseModel):
@@ -39,6 +77,22 @@ class Book(BaseModel):
     image_url: str
     amazon_link: str
     featured: bool = False
+    image_variants: Dict[str, Dict[str, str]] = {}
+    version: int = 0
+
+class BookFields(BaseModel):
+    """A book with only the fields requested through ?fields="""
+    id: Optional[str] = None
+    title: Optional[str] = None
+    author: Optional[str] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    image_url: Optional[str] = None
+    amazon_link: Optional[str] = None
+    featured: Optional[bool] = None
+    image_variants: Optional[Dict[str, Dict[str, str]]] = None
+    version: Optional[int] = None
 
 class BookCreate(BaseModel):
     title: str
@@ -50,296 +104,468 @@ class BookCreate(BaseModel):
     featured: bool = False
 
 class BookUpdate(BaseModel):
-    title: Optional[str]
-    author: Optional[str]
-    category: Optional[str]
-    description: Optional[str]
-    price: Optional[float]
-    amazon_link: Optional[str]
-    featured: Optional[bool]
-
-# Initialize sample data with Amazon links
-sample_books = [
-    # Young Readers Category
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Bubble Bears Great Adventure",
-        "author": "Garry Jordan",
-        "category": "Young Readers",
-        "description": "Join Bubble Bear on an amazing adventure filled with friendship, discovery, and fun! A delightful story that teaches children about courage, friendship, and the joy of exploration.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/ccHc420q/Whats-App-Image-2025-06-25-at-6-02-11-AM-1.jpg",
-        "amazon_link": "https://www.amazon.com/BUBBLE-BEARS-GREAT-ADVENTURE-JORDAN/dp/B0BMTBF9F3/ref=mp_s_a_1_1?crid=3LCYDJ7PUTNVO&dib=eyJ2IjoiMSJ9.zMiTxvjHBD5Okjxj1WV7oHmKs9mDj1jDFhl0tlBp3_faUGF6BJELlPf2_PZuayQ6hFhLngEKslGOABLa2xgRXRGeSdu678bD4yQjFrMDywWgPz1tuu03_bJiSC9ZMz-l14uClNIg-qRDfvvodlCj18n75k_H8Rp26u-Y4QPEPY53n5Hgons7YOf6iWtocwr9VECQuF_QAX5JtJdP1PdHOA.tSnVdBVDH62wm-9xfQXDsPO_cHgJPKTQ37nl3y1bB6E&dib_tag=se&keywords=bubble+bears+great+adventure&qid=1750869871&sprefix=bubble+bears+great+adventure+%2Caps%2C175&sr=8-1",
-        "featured": True
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Bubble Bear and Friends First Day of School",
-        "author": "Garry Jordan",
-        "category": "Young Readers",
-        "description": "Experience the excitement and nervousness of the first day of school with Bubble Bear and friends. A heartwarming tale about new beginnings and making friends.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/GvVq7Tc8/Whats-App-Image-2025-06-25-at-6-02-11-AM-3.jpg",
-        "amazon_link": "https://www.amazon.com/BUBBLE-BEAR-FRIENDS-FIRST-SCHOOL/dp/B0F7HHQW64/ref=mp_s_a_1_1?crid=3M9AR3HHCF9C9&dib=eyJ2IjoiMSJ9.MQiwt2XMDbxFZ8pHvFnUpB4adSJ9hzyXRHYh_735gEPAobHpcA_TaNn68UxxKSyEfU2KqJbOAR7kB9QwF3O7pz6Ful1OmPP0fx3AEr11W7H1-UX3OwzP2wdoXgk6KxqMel4AWjrUtZ8y7bHNjidftQHyPXtdUVv8CLUIbZ82EClRr53pO6GszmLhf0tuXr9B7x-VFIIDyQeCsAe9Z1Kvkg.ZWbrEGQ1IKC-5fTBe0SXZ5iXAhOLdk67Huy91LDrx7c&dib_tag=se&keywords=bubble+bear+and+friends+first+day+of+school&qid=1750870089&sprefix=bubble+bear+and+friends+first+day+of+school+%2Caps%2C137&sr=8-1",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Bubble Bear and the Mystery of the Pumpkin Pirate",
-        "author": "Garry Jordan",
-        "category": "Young Readers",
-        "description": "A thrilling mystery adventure as Bubble Bear solves the case of the mysterious Pumpkin Pirate. Perfect for young readers who love mysteries and adventures.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/Pv0BQ11t/Whats-App-Image-2025-06-25-at-6-02-11-AM-4.jpg",
-        "amazon_link": "https://www.amazon.com/BUBBLE-BEAR-MYSTERY-PUMPKIN-PIRATE/dp/B0F6YT5JRK/ref=mp_s_a_1_1?crid=20YNIRMY8IWM4&dib=eyJ2IjoiMSJ9.DcQo4WgnkQ64_DSrNqTu0_FfY0MithJLNs5pbKnlsHA.EhtsbaUSFbgXi3691EZifet2A52JcepMpkdmmt1JuaA&dib_tag=se&keywords=bubble+bear+and+the+mystery+of+the+pumpkin+pirate&qid=1750870039&sprefix=bubble+bear+and+the+mystery+of+the+pumpkin+pirate+%2Caps%2C162&sr=8-1",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Bubble Bear and Friends Defeat Biggie the Bully",
-        "author": "Garry Jordan",
-        "category": "Young Readers",
-        "description": "Learn about courage and friendship as Bubble Bear and friends stand up to bullying. An important story about standing up for what's right and supporting friends.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/VYPTXpPm/d0c08a16-ae98-4080-af6a-0e96ba485193.jpg",
-        "amazon_link": "https://www.amazon.com/BUBBLE-FRIENDS-DEFEAT-BIGGIE-BULLY/dp/B0F8T4GMM9/ref=mp_s_a_1_1?crid=3IPJKBYV19AR0&dib=eyJ2IjoiMSJ9.oDIHlFRiPvWjqjy-PlEMHg.GryUjrX8u79EEWzFW3d8wztXazCYzEGYlVr8LMmSudw&dib_tag=se&keywords=bubble+bear+and+friends+defeat+biggie+the+bully&qid=1750869990&sprefix=bubble+bear+and+friends+defeat+biggie+the+bully+%2Caps%2C130&sr=8-1",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Bubble Bear and Friends Christmas",
-        "author": "Garry Jordan",
-        "category": "Young Readers",
-        "description": "Celebrate the magic of Christmas with Bubble Bear and friends in this heartwarming holiday tale. A perfect Christmas story for young readers.",
-        "price": 22.99,
-        "image_url": "https://i.ibb.co/8nrLzvF3/Whats-App-Image-2025-06-25-at-6-02-11-AM.jpg",
-        "amazon_link": "https://www.amazon.com/BUBBLE-FRIENDS-CHRISTMAS-GARRY-JORDAN/dp/B0F5WTHWMS/ref=mp_s_a_1_1?crid=12BVT2EI2G2XG&dib=eyJ2IjoiMSJ9.7sHz7QmP9SDRAoBGsM3OLoEQKiId3V3SyLAXAELdXTVehW61n3finAY4lgwLlgwQVyLjrFmlEH2FeQf-j3TFKIe3ZBy4iX6ys1Z-fY5XZDGsX1APF73v7lU7-KYZUo0Cv3qB_f8fHemo3M7sqWAeDhh0mdBLkCLPTI_VktvzZdEMglV-k-ZlimNFewTBTA9YtnZTzj1IikPmsLgR9XS-6A.IxPV_VU5P40N0eN4fzNGjtkNzOqRepLGM5LZSBRc1eo&dib_tag=se&keywords=bubble+bear+and+friends+Christmas&qid=1750869945&sprefix=bubble+bear+and+friends+christmas+%2Caps%2C162&sr=8-1",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Little Willie Learns a Lot",
-        "author": "Garry Jordan",
-        "category": "Young Readers",
-        "description": "An educational adventure with Little Willie as he discovers new things about the world around him. A delightful learning journey for curious young minds.",
-        "price": 14.99,
-        "image_url": "https://i.ibb.co/QvZ7ps9s/710decf7-f741-46a1-8557-8c6c70da4cbb.jpg",
-        "amazon_link": "https://www.amazon.com/LITTLE-WILLIE-LEARNS-GARRY-JORDAN/dp/B0F9KXP8PF/ref=mp_s_a_1_1?crid=247E0FOLQN4KB&dib=eyJ2IjoiMSJ9.XBaH46N4mecuDPeNTkjk3aInylHbla_7GDbPOY-yb354rg1vHVeB_lvudnYC7yC11iIJLszYJ-hcG6-PnWHvG22asU4bzJip-ct0LEmOnBHKHRTmOotKjjwFDc_ARR-O41lsh5ErBQsK7UTtqUnLrA.1MKE9Y7Lk9Vb-Y5PD2NlbMjxaVoZ6R0Ao_AxLfuc6eU&dib_tag=se&keywords=Little+Willie+learns+a+lot&qid=1750870137&sprefix=little+willie+learns+a+lot+%2Caps%2C176&sr=8-1",
-        "featured": False
-    },
-    
-    # Business & Self-Help Category
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Think Rich and Grow Rich",
-        "author": "Garry Jordan",
-        "category": "Business & Self-Help",
-        "description": "Unlock the secrets to building wealth and achieving financial success through proven strategies and timeless principles that have helped countless individuals achieve prosperity.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/TMSQVDWc/Whats-App-Image-2025-06-25-at-6-02-12-AM.jpg",
-        "amazon_link": "https://www.amazon.com/THINK-RICH-BECOME-Guide-Getting/dp/B0F2FSN68B/ref=mp_s_a_1_1?crid=352Z8HR5JV8WR&dib=eyJ2IjoiMSJ9.nT0Dxxe3UmxKZ0xDZfx3dLmafIgJ7Xv1o9Dt90eB-b13LAhjlZ_iW8rrxfxHoejbwLaPQuX6JY56M5d4st7joVh0OWFSAUt4MBG4Tm26wExH6gHT_T3Os6r0JE_aLb12spiuT0CTAZOj93WfJ2KzSawhC1eQM8co-ndER2RDlNmgky5zMrKPplMxTdYY3HB2ZxudUh5xHZs56qFke7MTfw.0u9v0LIcx6t-gI_fxrJRp0cvs4MuuTIlZElY3Ks-KA0&dib_tag=se&keywords=think+rich+and+become+rich&qid=1750870362&s=books&sprefix=think+rich+and+become+rich%2Caps%2C298&sr=1-1",
-        "featured": True
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "100 Side Hustles That Will Make You a Millionaire",
-        "author": "Garry Wiggins",
-        "category": "Business & Self-Help",
-        "description": "Discover 100 proven side hustles and business ideas that can transform your financial future. From digital marketing to real estate, find the perfect opportunity for you.",
-        "price": 29.99,
-        "image_url": "https://i.ibb.co/8g6NMs89/Whats-App-Image-2025-06-25-at-6-02-12-AM-2.jpg",
-        "amazon_link": "https://www.amazon.com/SIDE-HUSTLES-THAT-WILL-MILLIONAIRE/dp/B0F2SCRC4V/ref=mp_s_a_1_4?crid=2TV6D1Q28HFU6&dib=eyJ2IjoiMSJ9.F7ZZyy7aws5oIe4wNdcipUPIZibNxvfLR_WWgEfLMr3Dz8m7uR_pjfdNeiV6gHFVtVcOoZ3eQB5AJFQ3qq_P7AWOtTaMQsqvFxbaBCfRmaTqeWzX6nA8eMRsUlLV6MVn.g38EHiyj4bedGGQtIGASFYqMPgmqvkKE-rV98f1lm0s&dib_tag=se&keywords=garry.+Wiggins&qid=1750870433&sprefix=garry.+wiggins+%2Caps%2C158&sr=8-4",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "What the Billionaires Won't Tell You",
-        "author": "Garry Jordan",
-        "category": "Business & Self-Help",
-        "description": "Insider secrets and strategies from the world's wealthiest individuals. Learn the mindset and tactics that separate the ultra-wealthy from everyone else.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/fzR440YM/Whats-App-Image-2025-06-25-at-6-02-12-AM-1.jpg",
-        "amazon_link": "https://www.amazon.com/WHAT-BILLIONAIRES-WONT-TELL-YOU/dp/B0F3DH6NXM/ref=mp_s_a_1_1?dib=eyJ2IjoiMSJ9.mnhNTE9XZcrb2HggfLKzFw.RNO2n5n_ziy3CNkzURgC1q6wiy1eh0eDgu23cYluBoA&dib_tag=se&keywords=What+Billionaires+Won%27t+Tell+You+Garry+Jordan&qid=1750871476&sr=8-1",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "The AI Millionaire",
-        "author": "Dr. Orion Vexel",
-        "category": "Business & Self-Help",
-        "description": "Harness the power of artificial intelligence to build wealth in the digital age. Learn cutting-edge strategies for leveraging AI in business and investments.",
-        "price": 29.99,
-        "image_url": "https://i.ibb.co/4Z5cv9rV/1a7d4246-702f-488f-bd88-4761f0f37e10.jpg",
-        "amazon_link": "https://www.amazon.com/AI-MILLIONAIRE-Fortune-Automated-Intelligence/dp/B0F2XRJJKL/ref=mp_s_a_1_1?dib=eyJ2IjoiMSJ9.xy_6XUK1rjM43C7QFi-2rg.f5Y8Vnx7rHhG6lKDb0GREQmBFxJDOmQYkvr3luYFhP8&dib_tag=se&keywords=AI+Millionaire+Dr+Orion+Vexel&qid=1750783916&sr=8-1",
-        "featured": True
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "The Art of Hustling",
-        "author": "Garry Wiggins",
-        "category": "Business & Self-Help",
-        "description": "Master the mindset and skills needed to succeed in any entrepreneurial venture. Learn the art of turning opportunities into profitable businesses.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/XxF42Xmm/Whats-App-Image-2025-06-25-at-6-58-45-AM.jpg",
-        "amazon_link": "https://www.amazon.com/ART-HUSTLING-Getting-Rich-Legal/dp/B0F24JZC8R/ref=mp_s_a_1_3?crid=OAO56LR805XE&dib=eyJ2IjoiMSJ9.Z3V5gFceIwWKvMnefSapjZpblUWydgVtptHkosccWmauWskJwvw8ts-Je6HJOOGa64i5hpnT96szbiUuW0Ij5WWR0mefvGZGp8Gljidv4P_qeWzX6nA8eMRsUlLV6MVn.RndSk74SZt2XDRkGWlf-z5KjOZBsOF1E3jSRq6b4IOo&dib_tag=se&keywords=garry+Wiggins&qid=1750870505&sprefix=garry+wiggins+%2Caps%2C186&sr=8-3",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "The Secrets of Getting Rich",
-        "author": "Preston Rockefeller",
-        "category": "Business & Self-Help",
-        "description": "Time-tested principles and strategies for building lasting wealth from one of America's most prominent financial families.",
-        "price": 24.99,
-        "image_url": "https://i.ibb.co/KjhqmFvT/Whats-App-Image-2025-06-25-at-6-02-12-AM-3.jpg",
-        "amazon_link": "https://www.amazon.com/SECRETS-GETTING-RICH-What-Rich/dp/B0F1YW1PX2/ref=mp_s_a_1_1?dib=eyJ2IjoiMSJ9.lZ6YQzyGwhCO1depCr_VfQ.NW9Z5Htw9txoLz7uipQAYCyfYDuIu8uAc09q2Lg8M7o&dib_tag=se&keywords=Secrets+Getting+Rich+Preston+Rockefeller&qid=1750871579&sr=8-1",
-        "featured": False
-    },
-    
-    # Action & Thriller Category
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Today You Will Die",
-        "author": "Garry Wiggins",
-        "category": "Action & Thriller",
-        "description": "A heart-pounding thriller that will keep you on the edge of your seat until the very last page. When death comes calling, every second counts.",
-        "price": 14.99,
-        "image_url": "https://i.ibb.co/XxQpTTnn/Whats-App-Image-2025-06-25-at-7-05-03-AM.jpg",
-        "amazon_link": "https://www.amazon.com/TODAY-YOU-WILL-GARRY-WIGGINS-ebook/dp/B0F3K1FP6V/ref=mp_s_a_1_1?crid=11EV9HVUL1ZN6&dib=eyJ2IjoiMSJ9.YVuMKbGX1ZD4YjHzRwerxY6Z0QNh3_CMWVteYaJMCTxf5EuWAFTBq1o4v4MRckNVi95u_SIcM7eXSjl5sLPGf8MvaZ1Br68Flibt_xuDl34W6wvUN8B026k_qvVvLWaG9N4BwjaAS3IN8HrxUXn5XCVe8N-b-kRJlhTGvCh3kpCker3T1qY3lTKSecY8ClM-4RlZsj6HmHUQGRt0A8h-uA.gGw_M1uP_fAxs5OyOJ3lRQGldaQ-_0bNsZw7wi9XkeA&dib_tag=se&keywords=today+you+will+die&qid=1750869734&sprefix=today+you+will+die+%2Caps%2C193&sr=8-1",
-        "featured": True
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "The Midnight Heist",
-        "author": "Garry Wiggins",
-        "category": "Action & Thriller",
-        "description": "A sophisticated crime thriller involving the perfect heist and unexpected twists. When the stakes are high, trust no one.",
-        "price": 14.99,
-        "image_url": "https://i.ibb.co/WvZFWsP4/Whats-App-Image-2025-06-25-at-6-02-11-AM-2.jpg",
-        "amazon_link": "https://www.amazon.com/MIDNIGHT-HEIST-Mamba-GARRY-WIGGINS/dp/B0BMSKYTSS/ref=mp_s_a_1_2?crid=2SJ6UEKAK7V52&dib=eyJ2IjoiMSJ9.yo5-GNmWe7bwpDeRA_Lip7bNHpQzxc-fwo-v1QdoQxOZHiwvdvTLNdfFrVbVKNBQZa3dttudyr1QpnHwLh7FVSkWwSLO7R4zXP5uMcCsZQ_qJ-yAyIPTySG28oBqG_KJ6mRZBdsaMCoILhyL81FwNJjSqx1hJeuTEF0GbdY0QDNK1iv48oD7Xm8YeoPv8qB9iBjrOcg2hUBGd4hf5aZuXw.yuLOD_yP7uUeByDw3APJ3WIUsM3AmQ9pkNQ3QVodlm0&dib_tag=se&keywords=the+midnight+heist&qid=1750869806&sprefix=the+midnight+heist+%2Caps%2C280&sr=8-2",
-        "featured": False
-    },
-    
-    # Legal Information Category
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Beating the Feds",
-        "author": "Garry Wiggins",
-        "category": "Legal Information",
-        "description": "Essential legal strategies and knowledge for navigating federal regulations and procedures. A comprehensive guide to understanding federal law.",
-        "price": 49.99,
-        "image_url": "https://i.ibb.co/KvYkBSK/Whats-App-Image-2025-06-25-at-7-10-29-AM.jpg",
-        "amazon_link": "https://www.amazon.com/Beating-Feds-comprehensive-Successful-Information/dp/B0BMT22BMD/ref=mp_s_a_1_2?crid=1NEIDW5E8YN3L&dib=eyJ2IjoiMSJ9.oD0wJZ3yHoi4Vngh4Pk_KZhvvGvXWwSXoC4LnOTjbDB-VRUx_ZpLMo6rqq4MCLJSRz-RGF6MiMCc3qZFnwGKbdku5UDKbJUTpZ1sZFsC3PE.8Cbjgq_LbZmreToepf_aebMej6Z3ZZrGKrg7sL21XDE&dib_tag=se&keywords=beating+the+feds&qid=1750869667&sprefix=beating+the+feds%2Caps%2C572&sr=8-2",
-        "featured": False
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "title": "Beating the Feds II",
-        "author": "Garry Wiggins",
-        "category": "Legal Information",
-        "description": "Advanced legal strategies and updated information for federal case management. The sequel to the bestselling legal guide.",
-        "price": 49.99,
-        "image_url": "https://i.ibb.co/P2k1zq3/Whats-App-Image-2025-06-25-at-6-02-11-AM-5.jpg",
-        "amazon_link": "https://www.amazon.com/BEATING-FEDS-comprehensive-successful-techniques/dp/B0F84JJLTD/ref=mp_s_a_1_1?crid=OAO56LR805XE&dib=eyJ2IjoiMSJ9.Z3V5gFceIwWKvMnefSapjZpblUWydgVtptHkosccWmauWskJwvw8ts-Je6HJOOGa64i5hpnT96szbiUuW0Ij5WWR0mefvGZGp8Gljidv4P_qeWzX6nA8eMRsUlLV6MVn.RndSk74SZt2XDRkGWlf-z5KjOZBsOF1E3jSRq6b4IOo&dib_tag=se&keywords=garry+Wiggins&qid=1750870505&sprefix=garry+wiggins+%2Caps%2C186&sr=8-1",
-        "featured": False
-    },
-      {
-        "id": str(uuid.uuid4()),
-        "title": "Beating The State. Florida Edition",
-        "author": "Garry Wiggins",
-        "category": "Legal Information",
-        "description": "Learn all of the strategies and techniques used by high powered attorney's to beat the toughest state crimes in Florida.",
-        "price": 49.99,
-        "image_url": "https://i.postimg.cc/W3dkgdsb/Whats-App-Image-2025-06-28-at-12-14-10-AM.jpg",
-        "amazon_link": "https://www.amazon.com/BEATING-STATE-Comprehensive-Successful-Information/dp/B0F4848WY2/ref=mp_s_a_1_1?crid=24MO7FU24DSKH&dib=eyJ2IjoiMSJ9.T4Bfe7nz3fdGzX1ev6h1I-ITWTXKVriWeKSduR_0hUtgBfB-x5yXxGvFV5ROqYOEs0-Ct1qDesU62X2HYM7Q2NQ2nFmy_TYEwn06R49g9DLhG1sIP4VBMqTpGbyrRKiBddyc_suPZlagyNrLuVwPA6mjbhZkUFzYKD_I1vuNaa7E8ox2h0kPbFXs8DxG0CoYwk1vbjJAtXfYrF4w_xPk2Q.hvUOM8DRn88iPgXHRE4oSyPh1WawUCdu0pAmBMHeGuA&dib_tag=se&keywords=beating+the+state&qid=1751050393&sprefix=beating+the+state+%2Caps%2C329&sr=8-1",
-        "featured": False
-    }
-]
+    title: Optional[str] = None
+    author: Optional[str] = None
+    category: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    amazon_link: Optional[str] = None
+    featured: Optional[bool] = None
+
+class SearchHit(Book):
+    score: float
+
+class SearchResults(BaseModel):
+    total: int
+    results: List[SearchHit]
+    facets: Dict[str, Dict[str, int]]
+
+class RelatedBook(Book):
+    score: float
+
+class GroupStats(BaseModel):
+    count: int
+    featured: int
+    min_price: float
+    max_price: float
+    avg_price: float
+
+# Read responses are validated and serialized once, then served from the cache
+book_adapter = TypeAdapter(Book)
+book_list_adapter = TypeAdapter(List[Book])
+book_fields_adapter = TypeAdapter(List[BookFields])
+
+# Books written while the views are being rebuilt, replayed onto the new ones
+pending_writes = None
+rebuild_running = False
+rebuild_requested = False
+# The catalogue fingerprint the views reflect, see BookRepository.fingerprint
+views_fingerprint = None
+refresh_task = None
+rebuild_task = None
+
+def fingerprint_after(fingerprint, book, index):
+    """The catalogue fingerprint once `book` has been written, given the views in `index`"""
+    count, versions = fingerprint
+    # Every write either inserts a book at version 1 or bumps one book's version
+    return count + (book["id"] not in index.books), versions + 1
+
+async def rebuild_views():
+    """Rebuild every in-memory view of the catalogue from the database
+
+    Requests made while a rebuild is running make it go round once more
+    rather than starting a second one alongside it.
+    """
+    global rebuild_running, rebuild_requested
+    rebuild_requested = True
+    if rebuild_running:
+        return
+    rebuild_running = True
+    try:
+        while rebuild_requested:
+            rebuild_requested = False
+            await load_views()
+            # Writes replayed onto the new related lists may already call for another vocabulary
+            rebuild_requested = rebuild_requested or related_books.needs_build()
+    finally:
+        rebuild_running = False
+
+async def load_views():
+    """Build fresh views from a snapshot of the catalogue and swap them in
+
+    The views are built off the event loop while the current ones keep
+    serving. Writes made meanwhile may be missing from the snapshot, so they
+    are recorded and replayed before the swap.
+    """
+    global search_index, catalog_stats, related_books, pending_writes, views_fingerprint
+    pending_writes = []
+    try:
+        # Read first, so a write that misses the snapshot shows up as a change later
+        fingerprint = await books_repo.fingerprint()
+        books = await books_repo.list()
+        fresh_search, fresh_stats, fresh_related = SearchIndex(), CatalogStats(), RelatedBooks()
+        await run_in_threadpool(fresh_search.build, books)
+        await run_in_threadpool(fresh_stats.build, books)
+        await fresh_related.build_async(books)
+        # Nothing is awaited from here on, so no write can slip in before the swap
+        for book in pending_writes:
+            fingerprint = fingerprint_after(fingerprint, book, fresh_search)
+            fresh_search.add(book)
+            fresh_stats.add(book)
+            fresh_related.schedule(book)
+        search_index, catalog_stats, related_books = fresh_search, fresh_stats, fresh_related
+        views_fingerprint = fingerprint
+    finally:
+        pending_writes = None
+    catalog_cache.invalidate()
+
+async def refresh_views_if_changed():
+    """Rebuild the views if the catalogue has changed behind this worker's back"""
+    if await books_repo.fingerprint() == views_fingerprint:
+        return False
+    await rebuild_views()
+    return True
+
+async def refresh_views_periodically():
+    while True:
+        await asyncio.sleep(VIEWS_REFRESH_SECONDS)
+        try:
+            await refresh_views_if_changed()
+        except Exception as e:
+            print(f"Refreshing catalogue views failed: {e}")
 
 @app.on_event("startup")
 async def startup_event():
-    # Clear existing data and insert sample books
-    db.books.delete_many({})
-    db.books.insert_many(sample_books)
-    print("Sample books inserted successfully!")
-
-@app.get("/api/books", response_model=List[Book])
-async def get_books(category: Optional[str] = None, featured: Optional[bool] = None):
-    """Get all books or filter by category/featured status"""
+    await ensure_indexes(db.books)
+    
+    # Add any missing seed books (see seed.py for SEED_MODE / SEED_FILE)
+    result = await seed_books(db)
+    await rebuild_views()
+    print(f"Catalogue seeding: {result}")
+    
+    global refresh_task
+    if VIEWS_REFRESH_SECONDS > 0:
+        refresh_task = asyncio.create_task(refresh_views_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global refresh_task, rebuild_task
+    tasks = [task for task in (refresh_task, rebuild_task) if task is not None]
+    refresh_task = rebuild_task = None
+    for task in tasks:
+        task.cancel()
+    # Let a cancelled rebuild unwind so the rebuild flags are left clear
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+MAX_PAGE_SIZE = 200
+
+@app.get("/api/books", response_model=List[BookFields], response_model_exclude_unset=True)
+async def get_books(
+    request: Request,
+    category: Optional[str] = None,
+    featured: Optional[bool] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = None,
+    fields: Optional[str] = None,
+):
+    """Get all books or filter by category/featured status
+
+    Pass `limit` to page through the results; the token for the next page is
+    returned in the X-Next-Cursor header and goes back in as `cursor`. `sort`
+    is one of id/title/price (prefix with - for descending) and `fields` is a
+    comma separated list of fields to return.
+    """
     query = {}
     if category:
         query["category"] = category
     if featured is not None:
         query["featured"] = featured
     
-    books = list(db.books.find(query, {"_id": 0}))
-    return books
+    try:
+        field_names = pagination.parse_fields(fields, Book.model_fields)
+        sort_field, direction = pagination.parse_sort(sort)
+        if cursor:
+            value, last_id = pagination.decode_cursor(cursor, sort_field, direction)
+            query = {"$and": [query, pagination.keyset_filter(sort_field, direction, value, last_id)]}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    projection = pagination.projection_for(field_names, sort_field)
+    
+    def select_fields(books):
+        if field_names is None:
+            return books
+        return [{name: book[name] for name in field_names if name in book} for book in books]
+    
+    def serialize(books):
+        return CachedBody.from_model(book_fields_adapter, select_fields(books), exclude_unset=True)
+    
+    if not (limit or cursor or sort):
+        async def load():
+            return serialize(await books_repo.list(query, projection))
+        body = await catalog_cache.get_or_load(("books", category, featured, fields), load)
+        return cached_response(request, body)
+    
+    page_size = limit or MAX_PAGE_SIZE
+    books = await books_repo.list(
+        query, projection, sort=pagination.sort_spec(sort_field, direction), limit=page_size + 1
+    )
+    headers = {}
+    if len(books) > page_size:
+        books = books[:page_size]
+        headers["X-Next-Cursor"] = pagination.encode_cursor(books[-1], sort_field, direction)
+    return cached_response(request, serialize(books), headers)
+
+@app.get("/api/books/export")
+async def export_books(category: Optional[str] = None):
+    """Stream the catalogue as NDJSON, one book per line"""
+    query = {"category": category} if category else {}
+    return StreamingResponse(
+        bulk.export_ndjson(books_repo.stream(
+            query, pagination.projection_for(Book.model_fields, "id"), sort=[("id", 1)]
+        )),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="books.ndjson"'},
+    )
 
 @app.get("/api/books/{book_id}", response_model=Book)
-async def get_book(book_id: str):
+async def get_book(book_id: str, request: Request):
     """Get a specific book by ID"""
-    book = db.books.find_one({"id": book_id}, {"_id": 0})
-    if not book:
+    async def load():
+        book = await books_repo.get(book_id)
+        if not book:
+            return None
+        return CachedBody.from_model(book_adapter, book, etag=version_etag(book.get("version")))
+    
+    body = await catalog_cache.get_or_load(("book", book_id), load)
+    if not body:
         raise HTTPException(status_code=404, detail="Book not found")
-    return book
+    return cached_response(request, body)
 
 @app.get("/api/categories")
-async def get_categories():
+async def get_categories(request: Request):
     """Get all book categories"""
-    categories = db.books.distinct("category")
-    return {"categories": categories}
+    async def load():
+        categories = await books_repo.categories()
+        return CachedBody(json.dumps({"categories": categories}).encode())
+    
+    body = await catalog_cache.get_or_load(("categories",), load)
+    return cached_response(request, body)
 
 @app.get("/api/featured-books", response_model=List[Book])
-async def get_featured_books():
+async def get_featured_books(request: Request):
     """Get featured books"""
-    books = list(db.books.find({"featured": True}, {"_id": 0}))
-    return books
+    async def load():
+        return CachedBody.from_model(book_list_adapter, await books_repo.list({"featured": True}))
+    
+    body = await catalog_cache.get_or_load(("featured",), load)
+    return cached_response(request, body)
 
 @app.post("/api/books", response_model=Book)
 async def create_book(book: BookCreate):
     """Create a new book"""
     book_dict = book.dict()
     book_dict["id"] = str(uuid.uuid4())
-    book_dict["image_url"] = "https://images.unsplash.com/photo-1544947950-fa07a98d237f"  # Default image
+    book_dict["image_url"] = DEFAULT_IMAGE_URL
+    book_dict["version"] = 1
+    # Lets a later seed or feed import recognise this book instead of adding it again
+    book_dict["natural_key"] = natural_key(book_dict)
     
-    db.books.insert_one(book_dict)
+    await books_repo.insert(book_dict)
+    refresh_book(book_dict)
     return book_dict
 
-@app.put("/api/books/{book_id}", response_model=Book)
-async def update_book(book_id: str, book_update: BookUpdate):
-    """Update a book"""
-    book = db.books.find_one({"id": book_id})
+@app.post("/api/books/bulk")
+async def bulk_import_books(request: Request, background_tasks: BackgroundTasks):
+    """Create or update many books from a streamed NDJSON or CSV body
+
+    Send `Content-Type: text/csv` for CSV with a header row, anything else is
+    read as NDJSON. Rows carrying an `id` update that book, other rows are
+    matched on their Amazon ASIN and rows with neither are added as new books.
+    Only the fields a row provides are changed. Invalid rows are reported by
+    row number and don't stop the import. Search, stats and related books
+    pick up small imports before the response and rebuild in the background
+    after large ones.
+    """
+    content_type = request.headers.get("content-type", "")
+    parse = bulk.parse_csv if "csv" in content_type else bulk.parse_ndjson
+    summary, written = await bulk.import_books(
+        db.books, BookCreate, parse(request.stream()), track=BULK_REFRESH_MAX_ROWS
+    )
+    
+    if not (summary["inserted"] or summary["updated"]):
+        return summary
+    if written is None:
+        catalog_cache.invalidate()
+        background_tasks.add_task(rebuild_views)
+    else:
+        for book in await books_repo.list({"$or": written}):
+            refresh_book(book)
+    return summary
+
+def expected_version_from(if_match):
+    """Version an If-Match header requires, or None for an unconditional write"""
+    try:
+        version = parse_if_match(if_match)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return None if version == "*" else version
+
+async def require_book(book_id, expected_version=None):
+    """Return a book, raising 404 when it doesn't exist and 409 when it isn't at `expected_version`"""
+    book = await books_repo.get(book_id)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
-    
-    update_data = {k: v for k, v in book_update.dict().items() if v is not None}
-    if update_data:
-        db.books.update_one({"id": book_id}, {"$set": update_data})
-    
-    updated_book = db.books.find_one({"id": book_id}, {"_id": 0})
-    return updated_book
+    if expected_version is not None and book.get("version", 0) != expected_version:
+        raise HTTPException(status_code=409, detail="Book was modified by someone else")
+    return book
+
+async def write_book(book_id, fields, expected_version=None):
+    """Atomically update a book and refresh the in-memory views
 
-@app.post("/api/books/{book_id}/upload-cover")
-async def upload_book_cover(book_id: str, file: UploadFile = File(...)):
-    """Upload a book cover image"""
-    book = db.books.find_one({"id": book_id})
+    Raises 404 when the book doesn't exist and 409 when it is no longer at
+    `expected_version`.
+    """
+    book = await books_repo.update(book_id, fields, expected_version=expected_version)
     if not book:
+        # Only a failed write pays for the extra lookup
+        if expected_version is not None and await books_repo.exists(book_id):
+            raise HTTPException(status_code=409, detail="Book was modified by someone else")
         raise HTTPException(status_code=404, detail="Book not found")
+    refresh_book(book)
+    return book
+
+def refresh_book(book):
+    """Bring the in-memory views up to date after a book changed"""
+    global views_fingerprint
+    # Our own writes shouldn't make the periodic refresh rebuild everything
+    if views_fingerprint is not None:
+        views_fingerprint = fingerprint_after(views_fingerprint, book, search_index)
+    catalog_cache.invalidate()
+    search_index.add(book)
+    catalog_stats.add(book)
+    # Related lists are patched on their worker thread, off the event loop
+    related_books.schedule(book)
+    if pending_writes is not None:
+        pending_writes.append(book)
+    elif related_books.needs_build():
+        start_rebuild()
+
+def start_rebuild():
+    """Rebuild the views in the background unless a rebuild is already underway"""
+    global rebuild_task
+    if not rebuild_running and (rebuild_task is None or rebuild_task.done()):
+        rebuild_task = asyncio.get_running_loop().create_task(rebuild_views())
+
+@app.put("/api/books/{book_id}", response_model=Book)
+async def update_book(
+    book_id: str,
+    book_update: BookUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+):
+    """Update a book
+
+    Send the book's ETag (for example "v3") as If-Match to only apply the
+    update if nobody else has changed the book since; a stale tag gets a 409.
+    """
+    expected_version = expected_version_from(if_match)
+    update_data = {k: v for k, v in book_update.dict().items() if v is not None}
+    if not update_data:
+        book = await require_book(book_id, expected_version)
+    else:
+        book = await write_book(book_id, update_data, expected_version)
     
-    # Save the uploaded file
-    file_extension = file.filename.split(".")[-1]
-    filename = f"{book_id}.{file_extension}"
-    file_path = f"uploads/{filename}"
+    response.headers["ETag"] = version_etag(book.get("version"))
+    return book
+
+async def build_cover_variants(book_id, path, digest, original_url):
+    """Generate resized covers and point the book at them"""
+    try:
+        variants = await covers.generate_variants(path, digest)
+    except Exception as e:
+        print(f"Cover variants failed for book {book_id}: {e}")
+        return
+    if not variants:
+        return
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Skip if another cover was uploaded while these were rendering
+    fields = {"image_url": variants["detail"]["jpeg"], "image_variants": variants}
+    book = await books_repo.update(book_id, fields, match={"image_url": original_url})
+    if book:
+        refresh_book(book)
+
+@app.post("/api/books/{book_id}/upload-cover", openapi_extra=covers.UPLOAD_OPENAPI)
+async def upload_book_cover(
+    book_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    if_match: Optional[str] = Header(None),
+):
+    """Upload a book cover image as the `file` field of a multipart form
+
+    The original is stored straight away; thumbnail, card and detail sizes
+    are generated in the background and listed in `image_variants`.
+    """
+    expected_version = expected_version_from(if_match)
+    # Stream the file out of the request body as it arrives
+    path, image_url, digest, created = await covers.save_upload(covers.multipart_file(request))
     
-    # Update book image URL
-    image_url = f"/uploads/{filename}"
-    db.books.update_one({"id": book_id}, {"$set": {"image_url": image_url}})
+    # Update book image URL; the conditional write is the only existence and version check
+    try:
+        await write_book(book_id, {"image_url": image_url, "image_variants": {}}, expected_version)
+    except HTTPException:
+        # Unknown or changed book: don't keep a file nothing points at
+        if created:
+            await run_in_threadpool(os.remove, path)
+        raise
+    background_tasks.add_task(build_cover_variants, book_id, path, digest, image_url)
     
     return {"message": "Cover uploaded successfully", "image_url": image_url}
 
+@app.get("/api/search", response_model=SearchResults)
+async def search_books(
+    q: str = "",
+    category: Optional[str] = None,
+    author: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Ranked full-text search over title, author and description
+
+    The last word of `q` also matches as a prefix and words with a single
+    typo still match. Facet counts cover every hit, not just the returned page,
+    and each facet ignores its own filter so the other choices keep their counts.
+    """
+    return search_index.search(q, category, author, min_price, max_price, limit)
+
+@app.get("/api/search/suggest")
+async def suggest_books(q: str, limit: int = Query(10, ge=1, le=50)):
+    """Autocomplete book titles for a partially typed query"""
+    return {"suggestions": search_index.suggest(q, limit)}
+
+@app.get("/api/categories/stats", response_model=Dict[str, GroupStats])
+async def get_category_stats():
+    """Book count, featured count and price range per category"""
+    return catalog_stats.summaries["category"]
+
+@app.get("/api/authors/stats", response_model=Dict[str, GroupStats])
+async def get_author_stats():
+    """Book count, featured count and price range per author"""
+    return catalog_stats.summaries["author"]
+
+@app.get("/api/books/{book_id}/related", response_model=List[RelatedBook])
+async def get_related_books(book_id: str, limit: int = Query(RELATED_LIMIT, ge=1, le=RELATED_LIMIT)):
+    """Books most similar to this one by title and description"""
+    related = related_books.get(book_id, limit)
+    # Mongo decides whether the book exists, since this worker's views may be behind
+    ids = [book_id] + [related_id for _, related_id in related]
+    books = {book["id"]: book for book in await books_repo.list({"id": {"$in": ids}})}
+    if book_id not in books:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return [
+        dict(books[related_id], score=round(score, 4))
+        for score, related_id in related
+        if related_id in books
+    ]
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Catalogue cache hit/miss counters"""
+    return catalog_cache.stats()
+
+@app.get("/api/diagnostics/query-plans")
+async def get_query_plans():
+    """Explain each route's query shape and flag collection scans and in-memory sorts"""
+    return await check_query_plans(db)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics"""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "message": "Literary Depot API is running"}
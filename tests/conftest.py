@@ -0,0 +1,32 @@
+"""Shared fixtures: the app runs against an in-process Mongo stand-in."""
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongomock://")
+os.environ.setdefault("SEED_MODE", "off")
+
+
+@pytest.fixture
+def client():
+    """Test client for the app, starting from an empty books collection"""
+    import server
+
+    asyncio.run(server.db.books.delete_many({}))
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def new_book():
+    """Factory for a valid POST /api/books body, with any fields overridden"""
+    def make(**overrides):
+        return dict({
+            "title": "Test Book", "author": "A", "category": "C", "description": "d",
+            "price": 5, "amazon_link": "https://example.com",
+        }, **overrides)
+    return make
@@ -0,0 +1,71 @@
+import asyncio
+import random
+
+from aggregates import RELATED_REBUILD_RATIO, RelatedBooks
+
+WORDS = [f"word{n}" for n in range(300)]
+
+
+def make_books(count, rng):
+    return [
+        {
+            "id": f"book{n}",
+            "title": " ".join(rng.choices(WORDS[:50], k=3)),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(5, 40))),
+        }
+        for n in range(count)
+    ]
+
+
+def brute_force(related):
+    """Every book's related list recomputed from scratch"""
+    dense = related._dense(range(len(related.ids)))
+    scores = dense.T @ dense
+    return {book_id: related._top(scores[row], row) for row, book_id in enumerate(related.ids)}
+
+
+def test_incremental_updates_match_a_full_comparison():
+    rng = random.Random(3)
+    books = make_books(300, rng)
+    related = RelatedBooks(limit=5, max_terms=8)
+    related.build(books[:250])
+    for book in books[250:]:
+        related.add(book)
+    for book in rng.sample(books, 40):
+        related.add(dict(book, description=" ".join(rng.choices(WORDS, k=10))))
+
+    expected = brute_force(related)
+    for book_id, pairs in expected.items():
+        assert [other for _, other in related.get(book_id)] == [other for _, other in pairs]
+
+
+def test_vectors_keep_only_the_strongest_terms():
+    related = RelatedBooks(max_terms=4)
+    related.build(make_books(50, random.Random(1)))
+    assert related.columns.shape == (50, 4)
+    assert all(0 < (row != 0).sum() <= 4 for row in related.weights)
+
+
+def test_too_many_books_disables_related_lists():
+    related = RelatedBooks(max_books=10)
+    related.build(make_books(11, random.Random(1)))
+    related.add({"id": "new", "title": "word1", "description": "word2"})
+    assert related.get("book0") == []
+
+
+def test_writes_past_the_ratio_call_for_a_build():
+    async def run():
+        empty = RelatedBooks()
+        empty.schedule({"id": "first", "title": "word1", "description": ""})
+        related = RelatedBooks()
+        related.build(make_books(50, random.Random(1)))
+        due = []
+        for n in range(int(RELATED_REBUILD_RATIO * 50) + 1):
+            due.append(related.needs_build())
+            related.schedule({"id": f"new{n}", "title": "word1", "description": "word2"})
+        return empty.needs_build(), due, related.needs_build()
+
+    empty, due, after = asyncio.run(run())
+    assert empty
+    assert not any(due)
+    assert after
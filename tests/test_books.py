@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+@pytest.fixture
+def book(client, new_book):
+    return client.post("/api/books", json=new_book()).json()
+
+
+def test_get_returns_version_etag(client, book):
+    response = client.get(f"/api/books/{book['id']}")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"v1"'
+
+
+def test_update_bumps_version(client, book):
+    response = client.put(f"/api/books/{book['id']}", json={"price": 7})
+    assert response.status_code == 200
+    assert response.json()["price"] == 7
+    assert response.headers["ETag"] == '"v2"'
+    assert client.get(f"/api/books/{book['id']}").json()["version"] == 2
+
+
+def test_update_unknown_book_is_404(client):
+    assert client.put("/api/books/nope", json={"price": 7}).status_code == 404
+    assert client.put("/api/books/nope", json={}).status_code == 404
+
+
+@pytest.mark.parametrize("if_match", ['"v1"', 'W/"v1"', '"v1-br"', "*"])
+def test_update_with_current_if_match(client, book, if_match):
+    response = client.put(f"/api/books/{book['id']}", json={"price": 7}, headers={"If-Match": if_match})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"v2"'
+
+
+def test_update_with_stale_if_match_is_409(client, book):
+    client.put(f"/api/books/{book['id']}", json={"price": 7})
+    response = client.put(f"/api/books/{book['id']}", json={"price": 9}, headers={"If-Match": '"v1"'})
+    assert response.status_code == 409
+    assert client.get(f"/api/books/{book['id']}").json()["price"] == 7
+
+
+def test_empty_update_still_checks_if_match(client, book):
+    response = client.put(f"/api/books/{book['id']}", json={}, headers={"If-Match": '"v5"'})
+    assert response.status_code == 409
+    response = client.put(f"/api/books/{book['id']}", json={}, headers={"If-Match": '"v1"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"v1"'
+
+
+def test_stale_if_match_on_unknown_book_is_404(client):
+    response = client.put("/api/books/nope", json={"price": 7}, headers={"If-Match": '"v1"'})
+    assert response.status_code == 404
+
+
+def test_malformed_if_match_is_400(client, book):
+    response = client.put(f"/api/books/{book['id']}", json={"price": 7}, headers={"If-Match": "etag"})
+    assert response.status_code == 400
+
+
+def search_titles(client, q):
+    return [hit["title"] for hit in client.get("/api/search", params={"q": q}).json()["results"]]
+
+
+def test_writes_during_a_rebuild_are_kept(client, new_book, monkeypatch):
+    import server
+
+    snapshot = server.books_repo.list
+    written = []
+
+    async def list_then_write(*args, **kwargs):
+        books = await snapshot(*args, **kwargs)
+        # Lands after the snapshot was read but before the new views are swapped in
+        if not written:
+            written.append(await server.create_book(server.BookCreate(**new_book(title="Midway"))))
+        return books
+
+    monkeypatch.setattr(server.books_repo, "list", list_then_write)
+    client.portal.call(server.rebuild_views)
+    monkeypatch.undo()
+
+    assert search_titles(client, "midway") == ["Midway"]
+    assert server.catalog_stats.summaries["category"]["C"]["count"] == 1
+
+
+def test_bulk_import_refreshes_search(client, new_book):
+    row = new_book(title="Imported", amazon_link="https://www.amazon.com/dp/B000000002")
+    assert client.post("/api/books/bulk", json=row).json()["inserted"] == 1
+    assert search_titles(client, "imported") == ["Imported"]
+
+
+def test_writes_from_other_workers_are_picked_up(client, new_book):
+    import server
+
+    async def write_elsewhere():
+        await server.db.books.insert_one(dict(new_book(title="Elsewhere"), id="other-worker", image_url="x", version=1))
+
+    assert not client.portal.call(server.refresh_views_if_changed)
+    client.portal.call(write_elsewhere)
+    assert search_titles(client, "elsewhere") == []
+    assert client.portal.call(server.refresh_views_if_changed)
+    assert search_titles(client, "elsewhere") == ["Elsewhere"]
+
+
+def test_own_writes_do_not_trigger_a_refresh(client, new_book):
+    import server
+
+    book_id = client.post("/api/books", json=new_book()).json()["id"]
+    client.put(f"/api/books/{book_id}", json={"price": 9})
+    assert not client.portal.call(server.refresh_views_if_changed)
+
+
+def test_related_books_of_a_book_another_worker_wrote(client, new_book):
+    import server
+
+    async def write_elsewhere():
+        await server.db.books.insert_one(dict(new_book(), id="other-worker", image_url="x", version=1))
+
+    client.portal.call(write_elsewhere)
+    # Not in this worker's views yet, but it exists
+    response = client.get("/api/books/other-worker/related")
+    assert response.status_code == 200
+    assert response.json() == []
+    assert client.get("/api/books/missing/related").status_code == 404
+
+
+def test_related_books_appear_when_starting_from_an_empty_catalogue(client, new_book):
+    # The startup build had no books, so there was no vocabulary to vectorise them with
+    titles = ["Lighthouse Keeper", "Lighthouse Storms", "Keeper Of Storms", "Desert Roads"]
+    ids = [client.post("/api/books", json=new_book(title=title)).json()["id"] for title in titles]
+
+    expected = {"Lighthouse Storms", "Keeper Of Storms"}
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        related = {book["title"] for book in client.get(f"/api/books/{ids[0]}/related").json()}
+        if related == expected:
+            break
+        time.sleep(0.05)
+    assert related == expected
@@ -0,0 +1,130 @@
+import asyncio
+import json
+
+import pytest
+
+import bulk
+
+
+def collect(generator):
+    async def run():
+        return [item async for item in generator]
+    return asyncio.run(run())
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def test_iter_lines_splits_across_chunks():
+    lines = collect(bulk.iter_lines(chunks(b"one\ntw", b"o\n", b"", b"three")))
+    assert lines == ["one", "two", "three"]
+
+
+def test_iter_lines_decodes_characters_split_between_chunks():
+    encoded = "café\nnaïve\n".encode()
+    split = encoded.index(b"\xc3") + 1
+    lines = collect(bulk.iter_lines(chunks(encoded[:split], encoded[split:])))
+    assert lines == ["café", "naïve"]
+
+
+def test_parse_ndjson_reports_bad_rows_by_number():
+    rows = collect(bulk.parse_ndjson(chunks(b'{"title": "a"}\n\n[1, 2]\n{nope\n{"title": "b"}')))
+    assert [number for number, _ in rows] == [1, 2, 3, 4]
+    assert rows[0][1] == {"title": "a"}
+    assert isinstance(rows[1][1], ValueError)
+    assert isinstance(rows[2][1], ValueError)
+    assert rows[3][1] == {"title": "b"}
+
+
+def test_parse_csv_keeps_quoted_newlines_and_drops_empty_cells():
+    body = (
+        b'title,description,price,featured\n'
+        b'"Night, Again","Line one\nline ""two""\n\nline four",9.99,\n'
+        b'\n'
+        b'Plain,Short,5,true\n'
+    )
+    rows = collect(bulk.parse_csv(chunks(body[:30], body[30:])))
+    assert rows == [
+        (1, {"title": "Night, Again", "description": 'Line one\nline "two"\n\nline four', "price": "9.99"}),
+        (2, {"title": "Plain", "description": "Short", "price": "5", "featured": "true"}),
+    ]
+
+
+@pytest.fixture
+def book_row(new_book):
+    """A feed row, by default carrying an ASIN"""
+    def make(**fields):
+        return new_book(**dict({"amazon_link": "https://www.amazon.com/dp/B000000001"}, **fields))
+    return make
+
+
+def ndjson(*rows):
+    return "\n".join(json.dumps(row) for row in rows)
+
+
+def test_import_reports_invalid_rows(client, book_row):
+    body = ndjson(book_row(), {"title": "No price"}) + "\n{broken"
+    summary = client.post("/api/books/bulk", content=body).json()
+    assert (summary["received"], summary["inserted"], summary["failed"]) == (3, 1, 2)
+    assert [error["row"] for error in summary["errors"]] == [2, 3]
+    assert "price" in summary["errors"][0]["error"]
+
+
+def test_import_updates_books_by_asin_without_resetting_omitted_fields(client, book_row):
+    client.post("/api/books/bulk", content=ndjson(book_row(featured=True)))
+    summary = client.post("/api/books/bulk", content=ndjson(book_row(price=12))).json()
+    assert (summary["inserted"], summary["updated"]) == (0, 1)
+
+    books = client.get("/api/books").json()
+    assert len(books) == 1
+    assert books[0]["price"] == 12
+    assert books[0]["featured"] is True
+
+
+def test_import_adds_rows_without_asin_as_new_books(client, book_row):
+    link = "https://example.com/book"
+    body = ndjson(book_row(amazon_link=link, author="A"), book_row(amazon_link=link, author="B"))
+    summary = client.post("/api/books/bulk", content=body).json()
+    assert (summary["inserted"], summary["updated"]) == (2, 0)
+    assert sorted(book["author"] for book in client.get("/api/books").json()) == ["A", "B"]
+
+
+def test_import_csv(client):
+    body = "title,author,category,description,price,amazon_link\nCsv Book,A,C,\"two\nlines\",7.5,x\n"
+    summary = client.post("/api/books/bulk", content=body, headers={"Content-Type": "text/csv"}).json()
+    assert summary["inserted"] == 1
+    assert client.get("/api/books").json()[0]["description"] == "two\nlines"
+
+
+def test_small_imports_patch_the_views_without_a_rebuild(client, book_row, monkeypatch):
+    import server
+    rebuilds = []
+    monkeypatch.setattr(server, "rebuild_views", lambda: rebuilds.append(1))
+    # Into an empty catalogue these would call for a new related-books vocabulary
+    monkeypatch.setattr(server.related_books, "needs_build", lambda: False)
+    body = ndjson(book_row(title="Lantern Bay"), book_row(title="Harbour Ice", amazon_link="x"))
+    client.post("/api/books/bulk", content=body)
+
+    assert rebuilds == []
+    hits = client.get("/api/search", params={"q": "lantern"}).json()["results"]
+    assert [hit["title"] for hit in hits] == ["Lantern Bay"]
+    assert sum(group["count"] for group in client.get("/api/categories/stats").json().values()) == 2
+
+
+def test_large_imports_rebuild_the_views(client, book_row, monkeypatch):
+    import server
+    rebuilds = []
+    monkeypatch.setattr(server, "rebuild_views", lambda: rebuilds.append(1))
+    monkeypatch.setattr(server, "BULK_REFRESH_MAX_ROWS", 1)
+    client.post("/api/books/bulk", content=ndjson(book_row(amazon_link="a"), book_row(amazon_link="b")))
+    assert rebuilds == [1]
+
+
+def test_export_only_has_public_fields(client, book_row):
+    client.post("/api/books/bulk", content=ndjson(book_row()))
+    lines = client.get("/api/books/export").text.splitlines()
+    assert len(lines) == 1
+    assert "natural_key" not in json.loads(lines[0])
+    assert json.loads(lines[0])["amazon_link"] == book_row()["amazon_link"]
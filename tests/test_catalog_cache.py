@@ -0,0 +1,88 @@
+import asyncio
+
+import catalog_cache
+from catalog_cache import CatalogCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(catalog_cache.time, "monotonic", clock)
+    cache = CatalogCache(ttl=10)
+    cache.set("a", 1)
+
+    clock.now += 9.9
+    assert cache.get("a") == (True, 1)
+    clock.now += 0.2
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["entries"] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = CatalogCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.evictions == 1
+
+
+def test_get_or_load_only_loads_on_a_miss():
+    cache = CatalogCache()
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return "value"
+
+    async def run():
+        return [await cache.get_or_load("k", load) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["value"] * 3
+    assert len(calls) == 1
+
+
+def test_none_is_not_cached():
+    cache = CatalogCache()
+
+    async def load():
+        return None
+
+    asyncio.run(cache.get_or_load("k", load))
+    assert cache.get("k") == (False, None)
+
+
+def test_read_loaded_across_an_invalidation_is_not_stored():
+    cache = CatalogCache()
+
+    async def run():
+        loading = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_load():
+            loading.set()
+            await release.wait()
+            return "stale"
+
+        read = asyncio.ensure_future(cache.get_or_load("k", slow_load))
+        await loading.wait()
+        # A write lands while the read is still waiting on the database
+        cache.invalidate()
+        release.set()
+        return await read
+
+    assert asyncio.run(run()) == "stale"
+    assert cache.get("k") == (False, None)
+    assert cache.version == 1
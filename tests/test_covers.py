@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import covers
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 100
+
+
+@pytest.fixture(autouse=True)
+def covers_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(covers, "COVERS_DIR", str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def book_id(client, new_book):
+    return client.post("/api/books", json=new_book()).json()["id"]
+
+
+def test_upload_stores_content_addressed_file(client, book_id, covers_dir):
+    response = client.post(f"/api/books/{book_id}/upload-cover", files={"file": ("c.bin", PNG)})
+    assert response.status_code == 200
+    assert response.json()["image_url"].endswith(".png")
+    assert [path.suffix for path in covers_dir.iterdir()] == [".png"]
+
+
+def test_upload_to_unknown_book_leaves_no_file(client, covers_dir):
+    response = client.post("/api/books/nope/upload-cover", files={"file": ("c.png", PNG)})
+    assert response.status_code == 404
+    assert list(covers_dir.iterdir()) == []
+
+
+def test_upload_with_stale_if_match_leaves_no_file(client, book_id, covers_dir):
+    response = client.post(
+        f"/api/books/{book_id}/upload-cover", files={"file": ("c.png", PNG)}, headers={"If-Match": '"v7"'}
+    )
+    assert response.status_code == 409
+    assert list(covers_dir.iterdir()) == []
+
+
+def test_upload_with_current_if_match(client, book_id):
+    response = client.post(
+        f"/api/books/{book_id}/upload-cover", files={"file": ("c.png", PNG)}, headers={"If-Match": '"v1"'}
+    )
+    assert response.status_code == 200
+    assert client.get(f"/api/books/{book_id}").headers["ETag"] == '"v2"'
+
+
+def test_upload_rejects_non_images(client, book_id, covers_dir):
+    response = client.post(f"/api/books/{book_id}/upload-cover", files={"file": ("c.png", b"GIF00a" * 10)})
+    assert response.status_code == 415
+    assert list(covers_dir.iterdir()) == []
+
+
+def test_upload_needs_the_file_field(client, book_id):
+    response = client.post(f"/api/books/{book_id}/upload-cover", files={"other": ("c.png", PNG)})
+    assert response.status_code == 400
+
+
+def test_oversized_content_length_is_rejected_before_reading(client, book_id, monkeypatch):
+    monkeypatch.setattr(covers, "MAX_COVER_BYTES", 1000)
+
+    def body():
+        raise AssertionError("body should not be read")
+        yield b""
+
+    response = client.post(
+        f"/api/books/{book_id}/upload-cover",
+        content=body(),
+        headers={"Content-Type": "multipart/form-data; boundary=x", "Content-Length": str(10 ** 9)},
+    )
+    assert response.status_code == 413
+
+
+class StreamedRequest:
+    """Just enough of a Request for multipart_file, counting the chunks it reads"""
+
+    def __init__(self, chunks):
+        self.headers = {"content-type": "multipart/form-data; boundary=x"}
+        self.chunks = chunks
+        self.read = 0
+
+    async def stream(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def test_oversized_chunked_body_stops_being_read(monkeypatch, covers_dir):
+    monkeypatch.setattr(covers, "MAX_COVER_BYTES", 1000)
+    head = b'--x\r\nContent-Disposition: form-data; name="file"; filename="c.png"\r\n\r\n'
+    request = StreamedRequest([head + PNG] + [b"\0" * 1024] * 1000)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(covers.save_upload(covers.multipart_file(request)))
+    assert error.value.status_code == 413
+    assert request.read < 5
+    assert list(covers_dir.iterdir()) == []
+
+
+def test_file_split_across_small_chunks_is_reassembled(covers_dir):
+    body = (b'--x\r\nContent-Disposition: form-data; name="file"; filename="c.png"\r\n\r\n'
+            + PNG + b"\r\n--x--\r\n")
+    request = StreamedRequest([body[i:i + 7] for i in range(0, len(body), 7)])
+
+    path, url, digest, created = asyncio.run(covers.save_upload(covers.multipart_file(request)))
+    with open(path, "rb") as f:
+        assert f.read() == PNG
+    assert url.endswith(".png")
+    assert created
+
+
+def test_small_chunks_are_written_in_large_buffers(monkeypatch, covers_dir):
+    writes = []
+    run_in_threadpool = covers.run_in_threadpool
+
+    async def counting(fn, *args):
+        if getattr(fn, "__name__", "") == "write":
+            writes.append(len(args[0]))
+        return await run_in_threadpool(fn, *args)
+
+    async def chunks():
+        yield PNG
+        for _ in range(64):
+            yield b"\0" * 4096
+
+    monkeypatch.setattr(covers, "run_in_threadpool", counting)
+    path, *_ = asyncio.run(covers.save_upload(chunks()))
+    assert sum(writes) == len(PNG) + 64 * 4096
+    assert len(writes) <= 5  # rather than one per chunk
+    assert all(size >= covers.WRITE_BUFFER_BYTES for size in writes[:-1])
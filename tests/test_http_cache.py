@@ -0,0 +1,90 @@
+import gzip
+from types import SimpleNamespace
+
+import pytest
+
+import http_cache
+from http_cache import CachedBody, cached_response, choose_encoding
+
+BIG = http_cache.MIN_COMPRESS_SIZE
+
+
+def request(**headers):
+    return SimpleNamespace(headers={name.replace("_", "-"): value for name, value in headers.items()})
+
+
+@pytest.fixture
+def body():
+    return CachedBody(b'{"books": "' + b"x" * 2048 + b'"}')
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0, gzip", "gzip"),
+    ("br; q=0.0, gzip;q=0", None),
+    ("deflate", None),
+    ("", None),
+    (None, None),
+])
+def test_choose_encoding(accept, expected):
+    assert choose_encoding(accept, BIG) == expected
+
+
+def test_small_bodies_are_not_compressed():
+    assert choose_encoding("gzip, br", BIG - 1) is None
+
+
+def test_gzip_without_brotli(monkeypatch):
+    monkeypatch.setattr(http_cache, "brotli", None)
+    assert choose_encoding("br, gzip", BIG) == "gzip"
+
+
+def test_identity_response(body):
+    response = cached_response(request(), body)
+    assert response.status_code == 200
+    assert response.body == body.body
+    assert response.headers["ETag"] == body.etag
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert "content-encoding" not in response.headers
+
+
+def test_gzip_response_has_its_own_etag(body):
+    response = cached_response(request(accept_encoding="gzip"), body)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.body) == body.body
+    assert response.headers["ETag"] == body.etag[:-1] + '-gzip"'
+    # Compressed once, then reused
+    assert cached_response(request(accept_encoding="gzip"), body).body is response.body
+
+
+@pytest.mark.parametrize("if_none_match", [
+    "{etag}", 'W/{etag}', '"other", {etag}', "{gzip_etag}", "*",
+])
+def test_matching_if_none_match_is_304(body, if_none_match):
+    header = if_none_match.format(etag=body.etag, gzip_etag=body.variant_etag("gzip"))
+    response = cached_response(request(if_none_match=header, accept_encoding="br"), body)
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["ETag"] == body.variant_etag("br")
+
+
+def test_other_etag_gets_the_body(body):
+    response = cached_response(request(if_none_match='"stale"'), body)
+    assert response.status_code == 200
+
+
+def test_extra_headers_are_kept_on_304(body):
+    response = cached_response(request(if_none_match=body.etag), body, {"X-Next-Cursor": "abc"})
+    assert response.status_code == 304
+    assert response.headers["X-Next-Cursor"] == "abc"
+
+
+def test_book_reads_revalidate(client, new_book):
+    book_id = client.post("/api/books", json=new_book()).json()["id"]
+    first = client.get(f"/api/books/{book_id}")
+    again = client.get(f"/api/books/{book_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+    client.put(f"/api/books/{book_id}", json={"price": 1})
+    changed = client.get(f"/api/books/{book_id}", headers={"If-None-Match": first.headers["ETag"]})
+    assert changed.status_code == 200
@@ -0,0 +1,74 @@
+import asyncio
+
+from pymongo.errors import OperationFailure
+
+from indexes import QUERY_SHAPES, check_query_plans, plan_stages
+
+IXSCAN_PLAN = {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "id"}}
+
+
+class FakeDb:
+    """Answers explain commands with a canned winning plan per collection filter"""
+
+    def __init__(self, plan=IXSCAN_PLAN, overrides=None, error=None):
+        self.plan = plan
+        self.overrides = overrides or {}
+        self.error = error
+
+    async def command(self, command):
+        if self.error:
+            raise self.error
+        explained = command["explain"]
+        plan = self.overrides.get(explained.get("filter", {}).get("category"), self.plan)
+        return {"queryPlanner": {"winningPlan": plan}}
+
+
+def test_plan_stages_follows_input_stage():
+    assert plan_stages({"stage": "LIMIT", "inputStage": IXSCAN_PLAN}) == ["LIMIT", "FETCH", "IXSCAN"]
+
+
+def test_plan_stages_walks_every_input_stage():
+    plan = {"stage": "SORT_MERGE", "inputStages": [
+        IXSCAN_PLAN,
+        {"stage": "FETCH", "inputStage": {"stage": "COLLSCAN"}},
+    ]}
+    assert plan_stages(plan) == ["SORT_MERGE", "FETCH", "IXSCAN", "FETCH", "COLLSCAN"]
+
+
+def test_plan_stages_of_a_leaf():
+    assert plan_stages({"stage": "EOF"}) == ["EOF"]
+    assert plan_stages({}) == []
+
+
+def test_indexed_plans_pass():
+    report = asyncio.run(check_query_plans(FakeDb()))
+    assert report["ok"]
+    assert len(report["plans"]) == len(QUERY_SHAPES)
+    assert report["plans"][0]["stages"] == ["FETCH", "IXSCAN"]
+
+
+def test_newer_servers_nest_the_plan_under_query_plan():
+    report = asyncio.run(check_query_plans(FakeDb(plan={"queryPlan": {"stage": "COLLSCAN"}})))
+    assert not report["ok"]
+    assert report["plans"][0]["collscan"] is True
+
+
+def test_collection_scan_fails_the_check():
+    db = FakeDb(overrides={"x": {"stage": "COLLSCAN"}})
+    report = asyncio.run(check_query_plans(db))
+    assert not report["ok"]
+    flagged = [plan["route"] for plan in report["plans"] if plan["collscan"]]
+    assert flagged == [name for name, command in QUERY_SHAPES if command.get("filter", {}).get("category") == "x"]
+
+
+def test_in_memory_sort_fails_the_check():
+    db = FakeDb(overrides={"x": {"stage": "SORT", "inputStage": IXSCAN_PLAN}})
+    report = asyncio.run(check_query_plans(db))
+    assert not report["ok"]
+    assert any(plan["sort"] and not plan["collscan"] for plan in report["plans"])
+
+
+def test_explain_errors_are_reported_not_passed():
+    report = asyncio.run(check_query_plans(FakeDb(error=OperationFailure("explain not supported"))))
+    assert not report["ok"]
+    assert all(plan["error"] == "explain not supported" for plan in report["plans"])
@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+from metrics import MongoCommandMetrics
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def observed(collection, command):
+    return sample("mongo_command_duration_seconds_sum", collection=collection, command=command)
+
+
+def requests(route, status):
+    return sample("http_requests_total", method="GET", route=route, status=status)
+
+
+def run_command(listener, request_id, name, command):
+    listener.started(SimpleNamespace(request_id=request_id, command_name=name, command=command))
+    listener.succeeded(SimpleNamespace(request_id=request_id, command_name=name, duration_micros=2000))
+
+
+def test_commands_are_labelled_with_their_collection():
+    listener = MongoCommandMetrics()
+    before = observed("metrics_test", "find"), observed("metrics_test", "getMore")
+    run_command(listener, 1, "find", {"find": "metrics_test", "filter": {}})
+    run_command(listener, 2, "getMore", {"getMore": 1234567, "collection": "metrics_test"})
+    after = observed("metrics_test", "find"), observed("metrics_test", "getMore")
+    assert after[0] - before[0] == pytest.approx(0.002)
+    assert after[1] - before[1] == pytest.approx(0.002)
+
+
+def test_requests_are_labelled_with_their_route_template(client):
+    before = requests("/api/books/{book_id}", "404")
+    client.get("/api/books/one")
+    client.get("/api/books/two")
+    assert requests("/api/books/{book_id}", "404") - before == 2
+    assert sample("http_requests_total", method="GET", route="/api/books/one", status="404") == 0
+    assert sample("http_request_duration_seconds_count", method="GET", route="/api/books/{book_id}") >= 2
+
+
+def test_unmatched_paths_share_one_label(client):
+    before = requests("<unmatched>", "404")
+    client.get("/no/such/page")
+    client.get("/another/missing/page")
+    assert requests("<unmatched>", "404") - before == 2
+    assert sample("http_requests_total", method="GET", route="/no/such/page", status="404") == 0
@@ -0,0 +1,76 @@
+import pytest
+
+import pagination
+
+
+def test_cursor_round_trip():
+    token = pagination.encode_cursor({"id": "b2", "price": 9.99, "title": "x"}, "price", -1)
+    assert "=" not in token
+    assert pagination.decode_cursor(token, "price", -1) == (9.99, "b2")
+
+
+def test_id_cursor_has_no_value():
+    token = pagination.encode_cursor({"id": "b2"}, "id", 1)
+    assert pagination.decode_cursor(token, "id", 1) == (None, "b2")
+
+
+@pytest.mark.parametrize("token", ["", "not a cursor", "e30", "bnVsbA"])
+def test_decode_rejects_garbage(token):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        pagination.decode_cursor(token, "id", 1)
+
+
+@pytest.mark.parametrize("field, direction", [("title", 1), ("price", -1)])
+def test_decode_rejects_other_sort_order(field, direction):
+    token = pagination.encode_cursor({"id": "b2", "price": 9.99}, "price", 1)
+    with pytest.raises(ValueError, match="sort order"):
+        pagination.decode_cursor(token, field, direction)
+
+
+def test_keyset_filter_on_id():
+    assert pagination.keyset_filter("id", 1, None, "b2") == {"id": {"$gt": "b2"}}
+    assert pagination.keyset_filter("id", -1, None, "b2") == {"id": {"$lt": "b2"}}
+
+
+def test_keyset_filter_breaks_ties_on_id():
+    assert pagination.keyset_filter("price", -1, 9.99, "b2") == {"$or": [
+        {"price": {"$lt": 9.99}},
+        {"price": 9.99, "id": {"$lt": "b2"}},
+    ]}
+
+
+def test_parse_sort():
+    assert pagination.parse_sort(None) == ("id", 1)
+    assert pagination.parse_sort("-price") == ("price", -1)
+    with pytest.raises(ValueError):
+        pagination.parse_sort("author")
+
+
+def test_pages_cover_every_book_once(client, new_book):
+    for n, price in enumerate([5, 5, 7, 9, 9, 9, 12]):
+        client.post("/api/books", json=new_book(title=f"Book {n}", price=price))
+    seen = []
+    params = {"limit": 2, "sort": "-price", "fields": "title"}
+    while True:
+        response = client.get("/api/books", params=params)
+        assert response.status_code == 200
+        seen += [book["title"] for book in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        params["cursor"] = cursor
+    assert sorted(seen) == sorted(f"Book {n}" for n in range(7))
+
+
+def test_bad_cursor_is_400(client):
+    assert client.get("/api/books", params={"cursor": "nope"}).status_code == 400
+
+
+@pytest.mark.parametrize("fields", [",", " , ", " "])
+def test_parse_fields_needs_a_name(fields):
+    with pytest.raises(ValueError, match="at least one field"):
+        pagination.parse_fields(fields, {"id": None})
+
+
+def test_empty_fields_is_400(client):
+    assert client.get("/api/books", params={"fields": ","}).status_code == 400
@@ -0,0 +1,112 @@
+import pytest
+
+from search_index import SearchIndex, within_one_typo
+
+
+def book(book_id, title, author="Ann", category="Fiction", price=10.0, description=""):
+    return {"id": book_id, "title": title, "author": author, "category": category,
+            "price": price, "description": description}
+
+
+@pytest.fixture
+def index():
+    index = SearchIndex()
+    index.build([
+        book("1", "Night Garden", category="Fiction", price=10),
+        book("2", "Night Train", category="Fiction", author="Bob", price=30),
+        book("3", "Night Sky", category="Science", price=12),
+        book("4", "Night Owls", category="Science", author="Bob", price=60),
+        book("5", "Day Trip", category="Travel", price=20),
+    ])
+    return index
+
+
+def test_each_facet_ignores_its_own_filter(index):
+    result = index.search("night", category="Science")
+    assert {hit["id"] for hit in result["results"]} == {"3", "4"}
+    assert result["facets"]["category"] == {"Fiction": 2, "Science": 2}
+    assert result["facets"]["author"] == {"Ann": 1, "Bob": 1}
+    assert result["facets"]["price_band"] == {"under-15": 1, "50-plus": 1}
+
+
+def test_facets_apply_the_other_filters(index):
+    result = index.search("night", category="Fiction", author="Bob", max_price=20)
+    assert result["total"] == 0
+    # Fiction by Bob exists but is over the price limit; Bob's other book is Science
+    assert result["facets"]["price_band"] == {"25-50": 1}
+    assert result["facets"]["category"] == {}
+    assert result["facets"]["author"] == {"Ann": 1}
+
+
+@pytest.mark.parametrize("a, b", [
+    ("night", "night"),
+    ("night", "nights"),   # insert
+    ("nights", "night"),   # delete
+    ("night", "niggt"),    # substitute
+    ("night", "nihgt"),    # swap
+    ("night", "ight"),     # delete at the start
+])
+def test_within_one_typo(a, b):
+    assert within_one_typo(a, b)
+
+
+@pytest.mark.parametrize("a, b", [
+    ("night", "nightly"),  # two inserts
+    ("night", "nxgxt"),    # two substitutions
+    ("night", "ntghi"),    # swap of letters that aren't neighbours
+    ("night", "ni"),
+])
+def test_not_within_one_typo(a, b):
+    assert not within_one_typo(a, b)
+
+
+def test_title_matches_outrank_description_matches():
+    index = SearchIndex()
+    index.build([
+        book("title", "Harbour Lights"),
+        book("description", "Quiet Evenings", description="a harbour town"),
+    ])
+    assert [hit["id"] for hit in index.search("harbour")["results"]] == ["title", "description"]
+
+
+def test_rarer_terms_weigh_more():
+    index = SearchIndex()
+    index.build([book(str(n), "Common Words") for n in range(5)] + [book("rare", "Common Zebra")])
+    scores = index.score("common zebra")
+    assert list(scores) == ["rare"]
+    assert index.score("zebra")["rare"] > index.score("common")["rare"]
+
+
+def test_every_query_word_must_match(index):
+    assert [hit["id"] for hit in index.search("night sky")["results"]] == ["3"]
+
+
+def test_only_the_last_word_is_a_prefix(index):
+    assert {hit["id"] for hit in index.search("night tr")["results"]} == {"2"}
+    # "nig" isn't last, so it has to be a whole word (or one typo away from one)
+    assert index.search("nig train")["results"] == []
+
+
+def test_typos_match_when_nothing_else_does(index):
+    assert {hit["id"] for hit in index.search("nihgt")["results"]} == {"1", "2", "3", "4"}
+
+
+def test_suggest_completes_titles(index):
+    assert index.suggest("da") == ["Day Trip"]
+
+
+def test_add_and_remove_keep_the_vocabulary_sorted_and_pruned(index):
+    index.add(book("6", "Zephyr Apple"))
+    assert index.terms == sorted(index.postings)
+    assert "zephyr" in index.terms and "apple" in index.terms
+
+    # Re-indexing drops the terms only the old version had
+    index.add(book("6", "Mango"))
+    assert "zephyr" not in index.terms and "zephyr" not in index.postings
+    assert index.terms == sorted(index.postings)
+
+    index.remove("6")
+    assert "mango" not in index.terms
+    assert index.terms == sorted(index.postings)
+    assert len(index) == 5
+    assert index.total_length == sum(index.doc_lengths.values())
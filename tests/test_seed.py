@@ -0,0 +1,81 @@
+import asyncio
+import json
+import uuid
+
+from mongomock_motor import AsyncMongoMockClient
+
+from seed import SEED_FILE, seed_books
+
+
+def seed_rows():
+    with open(SEED_FILE, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_seed_adopts_books_from_the_old_startup():
+    async def run():
+        db = AsyncMongoMockClient()["seed_test"]
+        # The old startup inserted the same books under random ids
+        legacy = [dict(row, id=str(uuid.uuid4())) for row in seed_rows()]
+        await db.books.insert_many([dict(book) for book in legacy])
+
+        await seed_books(db, mode="upsert")
+        books = await db.books.find({}, {"_id": 0}).to_list(None)
+        return legacy, books
+
+    legacy, books = asyncio.run(run())
+    assert len(books) == len(legacy)
+    assert {book["id"] for book in books} == {book["id"] for book in legacy}
+    assert all(book["natural_key"] for book in books)
+
+
+def test_seed_is_idempotent_and_keeps_edits():
+    async def run():
+        db = AsyncMongoMockClient()["seed_test"]
+        await seed_books(db, mode="upsert")
+        first = await db.books.find({}, {"_id": 0}).sort("id").to_list(None)
+        await db.books.update_one({"id": first[0]["id"]}, {"$set": {"price": 1.0}})
+        # A changed checksum forces the upsert to run again
+        await db.seed_state.delete_many({})
+        await seed_books(db, mode="upsert")
+        second = await db.books.find({}, {"_id": 0}).sort("id").to_list(None)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert [book["id"] for book in second] == [book["id"] for book in first]
+    assert second[0]["price"] == 1.0
+
+
+def test_reset_runs_once_per_seed_file():
+    async def run():
+        db = AsyncMongoMockClient()["seed_test"]
+        first = await seed_books(db, mode="reset")
+        await db.books.insert_one({"id": "added-after-reset", "title": "Kept"})
+        # Another worker, or a restart, with SEED_MODE=reset still set
+        second = await seed_books(db, mode="reset")
+        kept = await db.books.count_documents({"id": "added-after-reset"})
+        upsert = await seed_books(db, mode="upsert")
+        forced = await seed_books(db, mode="reset", force=True)
+        wiped = await db.books.count_documents({"id": "added-after-reset"})
+        return first, second, kept, upsert, forced, wiped
+
+    first, second, kept, upsert, forced, wiped = asyncio.run(run())
+    assert first.startswith("inserted")
+    assert second == "up to date"
+    assert kept == 1
+    assert upsert == "up to date"
+    assert forced.startswith("inserted")
+    assert wiped == 0
+
+
+def test_reset_after_an_upsert_still_wipes():
+    async def run():
+        db = AsyncMongoMockClient()["seed_test"]
+        await seed_books(db, mode="upsert")
+        await db.books.insert_one({"id": "stray", "title": "Stray"})
+        result = await seed_books(db, mode="reset")
+        return result, await db.books.count_documents({"id": "stray"})
+
+    result, stray = asyncio.run(run())
+    assert result.startswith("inserted")
+    assert stray == 0